@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Sequence
+from typing import Callable
+
+import httpx
+
+from .api import (
+    MEMO_MAX_BYTES,
+    AccessToken,
+    SpotifyEndpoints,
+    bearer,
+    chunked,
+    merge_batch_responses,
+)
+from .cache import CachedBatch, ResponseCache, conditional_headers, store_response
+from .config import ClientSettings, ConfigError
+from .constants import SPOTIFY_API_BASE_URL
+from .ratelimit import AsyncGate, RequestScheduler
+from .singleflight import AsyncSingleFlight
+
+
+class AsyncSpotifyClient(SpotifyEndpoints):
+    """Asyncio counterpart of ``SpotifyClient`` built on ``httpx.AsyncClient``.
+
+    Every endpoint method returns an awaitable. At most ``concurrency``
+    requests are in flight at once, however many are awaited together; the
+    limit is halved when Spotify throttles and grows back as requests succeed.
+    """
+
+    def __init__(
+        self,
+        *,
+        concurrency: int = 8,
+        timeout: float = 30.0,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+        scheduler: RequestScheduler | None = None,
+        cache: ResponseCache | None = None,
+        memo_ttl: float = 300.0,
+        memo_max_bytes: int = MEMO_MAX_BYTES,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        self.concurrency = concurrency
+        self.scheduler = scheduler or RequestScheduler()
+        self.cache = cache
+        self._gate = AsyncGate(concurrency)
+        self._flights = AsyncSingleFlight(
+            ttl=memo_ttl,
+            remember=lambda response: response.status_code == 200,
+            max_bytes=memo_max_bytes,
+            size=lambda response: len(response.content),
+        )
+        try:
+            self._http = httpx.AsyncClient(
+                base_url=SPOTIFY_API_BASE_URL,
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=max(max_connections, concurrency),
+                    max_keepalive_connections=max_keepalive_connections,
+                    keepalive_expiry=keepalive_expiry,
+                ),
+                http2=http2,
+                transport=transport,
+            )
+        except ImportError as exc:
+            raise ConfigError(
+                "ESPORIFAI_HTTP2 requires the optional 'h2' package: "
+                "pip install 'esporifai[http2]'"
+            ) from exc
+
+    @classmethod
+    def from_settings(cls, settings: ClientSettings, **kwargs) -> AsyncSpotifyClient:
+        kwargs.setdefault("concurrency", settings.concurrency)
+        return cls(
+            timeout=settings.request_timeout_seconds,
+            max_connections=settings.max_connections,
+            max_keepalive_connections=settings.max_keepalive_connections,
+            keepalive_expiry=settings.keepalive_expiry_seconds,
+            http2=settings.http2,
+            scheduler=RequestScheduler.from_settings(settings),
+            cache=ResponseCache.from_settings(settings),
+            **kwargs,
+        )
+
+    async def __aenter__(self) -> AsyncSpotifyClient:
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+        if self.cache is not None:
+            self.cache.close()
+
+    async def get(
+        self,
+        access_token: AccessToken,
+        path: str,
+        params: dict | None = None,
+        headers: dict | None = None,
+    ) -> httpx.Response:
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.scheduler.reserve())
+            async with self._gate:
+                response = await self._http.get(
+                    path,
+                    headers={**bearer(access_token), **(headers or {})},
+                    params=params,
+                )
+
+            delay = self.scheduler.retry_delay(response, attempt)
+            if delay is None:
+                if response.status_code != 429:
+                    self._gate.success()
+                return response
+
+            self._gate.throttled()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get_item(
+        self, access_token: AccessToken, endpoint: str, item_id: str
+    ) -> httpx.Response:
+        return await self._flights.do(
+            (endpoint, item_id),
+            lambda: self._get_item(access_token, endpoint, item_id),
+        )
+
+    async def _get_item(
+        self, access_token: AccessToken, endpoint: str, item_id: str
+    ) -> httpx.Response:
+        path = f"/{endpoint}/{item_id}"
+        if self.cache is None:
+            return await self.get(access_token, path)
+
+        entry = self.cache.get(endpoint, item_id)
+        if entry is not None and entry.fresh:
+            return entry.response()
+        response = await self.get(
+            access_token, path, headers=conditional_headers(entry)
+        )
+        return store_response(self.cache, endpoint, item_id, response, entry)
+
+    async def get_several(
+        self,
+        access_token: AccessToken,
+        endpoint: str,
+        key: str,
+        ids: Sequence[str],
+        batch_size: int,
+    ) -> httpx.Response:
+        batch = CachedBatch(self.cache, endpoint, key, ids)
+        if batch.misses:
+            response = await self._fetch_chunks(
+                access_token, endpoint, key, batch.misses, batch_size
+            )
+            if response.status_code != 200:
+                return response
+            batch.fill(response)
+        return batch.response()
+
+    async def _fetch_chunks(
+        self,
+        access_token: AccessToken,
+        endpoint: str,
+        key: str,
+        ids: Sequence[str],
+        batch_size: int,
+    ) -> httpx.Response:
+        responses = await asyncio.gather(
+            *(
+                self.get(access_token, f"/{endpoint}", {"ids": ",".join(chunk)})
+                for chunk in chunked(ids, batch_size)
+            )
+        )
+        return merge_batch_responses(key, list(responses))
+
+
+async def fetch_each(
+    fetch: Callable[[str], Awaitable[httpx.Response]],
+    ids: Sequence[str],
+    callback: Callable[[str, httpx.Response], None],
+) -> None:
+    """Fetch every ID concurrently and hand responses to ``callback`` in input order.
+
+    Requests are scheduled up front and throttled by the client's semaphore;
+    responses are delivered as soon as every earlier ID has been delivered.
+    """
+    tasks = [asyncio.ensure_future(fetch(_id)) for _id in ids]
+    try:
+        for _id, task in zip(ids, tasks):
+            callback(_id, await task)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def run_each(
+    endpoint: str,
+    access_token: AccessToken,
+    ids: Sequence[str],
+    callback: Callable[[str, httpx.Response], None],
+    *,
+    settings: ClientSettings,
+    concurrency: int | None = None,
+) -> None:
+    """Synchronous entry point that runs ``fetch_each`` for one endpoint method.
+
+    ``endpoint`` names a single-ID method such as ``"get_track_audio_analysis"``.
+    """
+
+    async def run() -> None:
+        # Each ID is fetched once, so memoizing responses would only pin them.
+        async with AsyncSpotifyClient.from_settings(
+            settings,
+            concurrency=concurrency or settings.concurrency,
+            memo_ttl=0,
+        ) as client:
+            fetch = getattr(client, endpoint)
+            await fetch_each(lambda _id: fetch(access_token, _id), ids, callback)
+
+    asyncio.run(run())
@@ -1,23 +1,346 @@
 from __future__ import annotations
 
-from typing import Sequence
+import atexit
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Union
 
 import httpx
 
+from .cache import CachedBatch, ResponseCache, conditional_headers, store_response
+from .config import ClientSettings, ConfigError, get_client_settings
 from .constants import SPOTIFY_API_BASE_URL
+from .ratelimit import RequestScheduler, ThreadGate
+from .serialization import loads
+from .singleflight import SingleFlight
 
+# Maximum number of IDs Spotify accepts in one ``ids=`` parameter.
+SEVERAL_TRACKS_LIMIT = 50
+SEVERAL_ARTISTS_LIMIT = 50
+SEVERAL_AUDIO_FEATURES_LIMIT = 100
 
-def spotify_get(access_token: str, path: str, params: dict | None = None) -> httpx.Response:
-    return httpx.get(
-        url=f"{SPOTIFY_API_BASE_URL}{path}",
-        headers={"Authorization": f"Bearer {access_token}"},
-        params=params,
-        timeout=30.0,
-    )
+# Response bytes a client keeps in its short-lived memo. Audio analyses run to
+# hundreds of KB each; repeats beyond this are served by the response cache.
+MEMO_MAX_BYTES = 16 * 1024 * 1024
+
+
+def chunked(ids: Sequence[str], size: int) -> list[list[str]]:
+    ids = list(ids)
+    return [ids[start : start + size] for start in range(0, len(ids), size)] or [[]]
+
+
+def merge_batch_responses(key: str, responses: list[httpx.Response]) -> httpx.Response:
+    """Combine per-chunk responses into one response shaped like a single call.
+
+    The first failed chunk is returned as-is so callers see the real error.
+    """
+    for response in responses:
+        if response.status_code != 200:
+            return response
+    if len(responses) == 1:
+        return responses[0]
+
+    items = [item for response in responses for item in loads(response.content)[key]]
+    return httpx.Response(200, json={key: items}, request=responses[0].request)
+
+
+# A token string, or a callable such as ``TokenManager.access_token`` that is
+# asked for the current token on every request attempt.
+AccessToken = Union[str, Callable[[], str]]
+
+
+def bearer(access_token: AccessToken) -> dict:
+    token = access_token() if callable(access_token) else access_token
+    return {"Authorization": f"Bearer {token}"}
+
+
+class SpotifyEndpoints(ABC):
+    """Endpoint methods shared by the sync and async clients.
+
+    Each method builds a request and hands it to ``self.get``, so it returns a
+    response for ``SpotifyClient`` and an awaitable for ``AsyncSpotifyClient``.
+    ``access_token`` may be a string or an ``AccessToken`` callable.
+    """
+
+    @abstractmethod
+    def get(
+        self,
+        access_token: AccessToken,
+        path: str,
+        params: dict | None = None,
+        headers: dict | None = None,
+    ):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_item(self, access_token: AccessToken, endpoint: str, item_id: str):
+        """Request ``/{endpoint}/{item_id}``, served from the cache when fresh.
+
+        Concurrent and recently completed lookups of the same item share one
+        request.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_several(
+        self,
+        access_token: AccessToken,
+        endpoint: str,
+        key: str,
+        ids: Sequence[str],
+        batch_size: int,
+    ):
+        """Request ``ids`` in chunks of ``batch_size`` and merge results in order.
+
+        Only unique IDs missing from the cache are requested.
+        """
+        raise NotImplementedError
+
+    def get_track(self, access_token: AccessToken, track_id: str):
+        return self.get_item(access_token, "tracks", track_id)
+
+    def get_several_tracks(self, access_token: AccessToken, track_ids: Sequence[str]):
+        return self.get_several(
+            access_token, "tracks", "tracks", track_ids, SEVERAL_TRACKS_LIMIT
+        )
+
+    def get_artist(self, access_token: AccessToken, artist_id: str):
+        return self.get_item(access_token, "artists", artist_id)
+
+    def get_several_artists(self, access_token: AccessToken, artist_ids: Sequence[str]):
+        return self.get_several(
+            access_token, "artists", "artists", artist_ids, SEVERAL_ARTISTS_LIMIT
+        )
+
+    def get_track_audio_analysis(self, access_token: AccessToken, track_id: str):
+        return self.get_item(access_token, "audio-analysis", track_id)
+
+    def get_user_top_items(
+        self,
+        access_token: AccessToken,
+        item_type: str,
+        limit: int = 20,
+        offset: int = 0,
+        time_range: str = "medium_term",
+    ):
+        params = {
+            "limit": limit,
+            "offset": offset,
+            "time_range": time_range,
+        }
+        return self.get(access_token, f"/me/top/{item_type}", params)
+
+    def get_user_recently_played(
+        self,
+        access_token: AccessToken,
+        timestamp: int,
+        direction: str = "before",
+        limit: int = 20,
+    ):
+        params = {
+            direction: timestamp,
+            "limit": limit,
+        }
+        return self.get(access_token, "/me/player/recently-played", params)
+
+    def get_track_audio_features(self, access_token: AccessToken, track_id: str):
+        return self.get_item(access_token, "audio-features", track_id)
+
+    def get_several_tracks_audio_features(
+        self, access_token: AccessToken, track_ids: Sequence[str]
+    ):
+        return self.get_several(
+            access_token,
+            "audio-features",
+            "audio_features",
+            track_ids,
+            SEVERAL_AUDIO_FEATURES_LIMIT,
+        )
+
+
+class SpotifyClient(SpotifyEndpoints):
+    """Long-lived Spotify Web API client backed by a pooled ``httpx.Client``.
+
+    Connections are kept alive between requests, so a batch job pays for the
+    TCP and TLS handshakes once instead of once per call. Requests are paced
+    by a ``RequestScheduler`` and throttled (429) responses are retried.
+    Catalog lookups go through ``cache`` when one is configured.
+    """
+
+    def __init__(
+        self,
+        *,
+        timeout: float = 30.0,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+        concurrency: int = 8,
+        scheduler: RequestScheduler | None = None,
+        cache: ResponseCache | None = None,
+        memo_ttl: float = 300.0,
+        memo_max_bytes: int = MEMO_MAX_BYTES,
+        transport: httpx.BaseTransport | None = None,
+    ):
+        self.concurrency = concurrency
+        self.scheduler = scheduler or RequestScheduler()
+        self.cache = cache
+        self._gate = ThreadGate(concurrency)
+        self._flights = SingleFlight(
+            ttl=memo_ttl,
+            remember=lambda response: response.status_code == 200,
+            max_bytes=memo_max_bytes,
+            size=lambda response: len(response.content),
+        )
+        try:
+            self._http = httpx.Client(
+                base_url=SPOTIFY_API_BASE_URL,
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive_connections,
+                    keepalive_expiry=keepalive_expiry,
+                ),
+                http2=http2,
+                transport=transport,
+            )
+        except ImportError as exc:
+            raise ConfigError(
+                "ESPORIFAI_HTTP2 requires the optional 'h2' package: "
+                "pip install 'esporifai[http2]'"
+            ) from exc
+
+    @classmethod
+    def from_settings(cls, settings: ClientSettings, **kwargs) -> SpotifyClient:
+        return cls(
+            timeout=settings.request_timeout_seconds,
+            max_connections=settings.max_connections,
+            max_keepalive_connections=settings.max_keepalive_connections,
+            keepalive_expiry=settings.keepalive_expiry_seconds,
+            http2=settings.http2,
+            concurrency=settings.concurrency,
+            scheduler=RequestScheduler.from_settings(settings),
+            cache=ResponseCache.from_settings(settings),
+            **kwargs,
+        )
+
+    def __enter__(self) -> SpotifyClient:
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._http.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def get(
+        self,
+        access_token: AccessToken,
+        path: str,
+        params: dict | None = None,
+        headers: dict | None = None,
+    ) -> httpx.Response:
+        attempt = 0
+        while True:
+            time.sleep(self.scheduler.reserve())
+            with self._gate:
+                response = self._http.get(
+                    path,
+                    headers={**bearer(access_token), **(headers or {})},
+                    params=params,
+                )
+
+            delay = self.scheduler.retry_delay(response, attempt)
+            if delay is None:
+                if response.status_code != 429:
+                    self._gate.success()
+                return response
+
+            self._gate.throttled()
+            time.sleep(delay)
+            attempt += 1
+
+    def get_item(
+        self, access_token: AccessToken, endpoint: str, item_id: str
+    ) -> httpx.Response:
+        return self._flights.do(
+            (endpoint, item_id),
+            lambda: self._get_item(access_token, endpoint, item_id),
+        )
+
+    def _get_item(
+        self, access_token: AccessToken, endpoint: str, item_id: str
+    ) -> httpx.Response:
+        path = f"/{endpoint}/{item_id}"
+        if self.cache is None:
+            return self.get(access_token, path)
+
+        entry = self.cache.get(endpoint, item_id)
+        if entry is not None and entry.fresh:
+            return entry.response()
+        response = self.get(access_token, path, headers=conditional_headers(entry))
+        return store_response(self.cache, endpoint, item_id, response, entry)
+
+    def get_several(
+        self,
+        access_token: AccessToken,
+        endpoint: str,
+        key: str,
+        ids: Sequence[str],
+        batch_size: int,
+    ) -> httpx.Response:
+        batch = CachedBatch(self.cache, endpoint, key, ids)
+        if batch.misses:
+            response = self._fetch_chunks(
+                access_token, endpoint, key, batch.misses, batch_size
+            )
+            if response.status_code != 200:
+                return response
+            batch.fill(response)
+        return batch.response()
+
+    def _fetch_chunks(
+        self,
+        access_token: AccessToken,
+        endpoint: str,
+        key: str,
+        ids: Sequence[str],
+        batch_size: int,
+    ) -> httpx.Response:
+        def fetch(chunk: list[str]) -> httpx.Response:
+            return self.get(access_token, f"/{endpoint}", {"ids": ",".join(chunk)})
+
+        chunks = chunked(ids, batch_size)
+        if len(chunks) == 1:
+            return fetch(chunks[0])
+
+        workers = min(self.concurrency, len(chunks))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            responses = list(executor.map(fetch, chunks))
+        return merge_batch_responses(key, responses)
+
+
+@lru_cache(maxsize=1)
+def get_client() -> SpotifyClient:
+    """Return the process-wide client shared by every API call."""
+    client = SpotifyClient.from_settings(get_client_settings())
+    atexit.register(client.close)
+    return client
+
+
+def spotify_get(
+    access_token: AccessToken, path: str, params: dict | None = None
+) -> httpx.Response:
+    return get_client().get(access_token, path, params)
 
 
 def get_track(
-    access_token: str,
+    access_token: AccessToken,
     track_id: str,
 ):
     """Get Spotify catalog information for a single track identified by its unique Spotify ID.
@@ -29,11 +352,11 @@ def get_track(
     artist_id : str
         Track's ID.
     """
-    return spotify_get(access_token, f"/tracks/{track_id}")
+    return get_client().get_track(access_token, track_id)
 
 
 def get_several_tracks(
-    access_token: str,
+    access_token: AccessToken,
     track_ids: Sequence[str],
 ):
     """Get Spotify catalog information for multiple tracks based on their Spotify IDs.
@@ -45,11 +368,11 @@ def get_several_tracks(
     artist_id : str
         Track's ID.
     """
-    return spotify_get(access_token, "/tracks", {"ids": ",".join(track_ids)})
+    return get_client().get_several_tracks(access_token, track_ids)
 
 
 def get_artist(
-    access_token: str,
+    access_token: AccessToken,
     artist_id: str,
 ):
     """Get Spotify catalog information for a single artist identified by their unique Spotify ID.
@@ -61,11 +384,11 @@ def get_artist(
     artist_id : str
         Track's ID.
     """
-    return spotify_get(access_token, f"/artists/{artist_id}")
+    return get_client().get_artist(access_token, artist_id)
 
 
 def get_several_artists(
-    access_token: str,
+    access_token: AccessToken,
     artist_ids: Sequence[str],
 ):
     """Get Spotify catalog information for several artists based on their Spotify IDs.
@@ -77,11 +400,11 @@ def get_several_artists(
     artist_id : str
         Track's ID.
     """
-    return spotify_get(access_token, "/artists", {"ids": ",".join(artist_ids)})
+    return get_client().get_several_artists(access_token, artist_ids)
 
 
 def get_track_audio_analysis(
-    access_token: str,
+    access_token: AccessToken,
     track_id: str,
 ):
     """Get a low-level audio analysis for a track in the Spotify catalog.
@@ -94,11 +417,11 @@ def get_track_audio_analysis(
     track_id : str
         Track's ID.
     """
-    return spotify_get(access_token, f"/audio-analysis/{track_id}")
+    return get_client().get_track_audio_analysis(access_token, track_id)
 
 
 def get_user_top_items(
-    access_token: str,
+    access_token: AccessToken,
     item_type: str,
     limit: int = 20,
     offset: int = 0,
@@ -122,16 +445,17 @@ def get_user_top_items(
         "medium_term" (approximately last 6 months), "short_term" (approximately last 4 weeks).
         Default: medium_term
     """
-    params = {
-        "limit": limit,
-        "offset": offset,
-        "time_range": time_range,
-    }
-    return spotify_get(access_token, f"/me/top/{item_type}", params)
+    return get_client().get_user_top_items(
+        access_token,
+        item_type,
+        limit=limit,
+        offset=offset,
+        time_range=time_range,
+    )
 
 
 def get_user_recently_played(
-    access_token: str,
+    access_token: AccessToken,
     timestamp: int,
     direction: str = "before",
     limit: int = 20,
@@ -150,15 +474,96 @@ def get_user_recently_played(
     limit : int, optional
         The maximum number of items to return, by default 20
     """
-    params = {
-        direction: timestamp,
-        "limit": limit,
-    }
-    return spotify_get(access_token, "/me/player/recently-played", params)
+    return get_client().get_user_recently_played(
+        access_token,
+        timestamp,
+        direction=direction,
+        limit=limit,
+    )
+
+
+def paginate(
+    response: httpx.Response,
+    next_response: Callable[[dict], httpx.Response | None],
+    max_items: int | None = None,
+) -> Iterator[dict]:
+    """Yield ``items`` from ``response`` and every page ``next_response`` returns.
+
+    Raises ``httpx.HTTPStatusError`` if any page fails.
+    """
+    count = 0
+    while response is not None and (max_items is None or count < max_items):
+        response.raise_for_status()
+        page = loads(response.content)
+        items = page.get("items") or []
+        for item in items:
+            yield item
+            count += 1
+            # Stop here rather than at the next item, before fetching another page.
+            if max_items is not None and count >= max_items:
+                return
+        if not items:
+            return
+        response = next_response(page)
+
+
+def iter_user_top_items(
+    access_token: AccessToken,
+    item_type: str,
+    limit: int = 50,
+    offset: int = 0,
+    time_range: str = "medium_term",
+    max_items: int | None = None,
+) -> Iterator[dict]:
+    """Lazily iterate over the current user's top artists or tracks.
+
+    Follows each page's ``next`` URL until the list runs out or ``max_items``
+    items have been yielded. Parameters match ``get_user_top_items``.
+    """
+
+    def next_response(page: dict) -> httpx.Response | None:
+        if not page.get("next"):
+            return None
+        return get_client().get(access_token, page["next"])
+
+    first = get_user_top_items(
+        access_token, item_type, limit=limit, offset=offset, time_range=time_range
+    )
+    return paginate(first, next_response, max_items)
+
+
+def iter_user_recently_played(
+    access_token: AccessToken,
+    timestamp: int,
+    direction: str = "before",
+    limit: int = 50,
+    max_items: int | None = None,
+) -> Iterator[dict]:
+    """Lazily iterate over recently played tracks, following the ``direction`` cursor.
+
+    With ``"before"`` the iterator walks back through history; with ``"after"``
+    it walks forward to the most recent play. Parameters match
+    ``get_user_recently_played``.
+    """
+    seen_cursors = {str(timestamp)}
+
+    def next_response(page: dict) -> httpx.Response | None:
+        cursor = (page.get("cursors") or {}).get(direction)
+        if not cursor or str(cursor) in seen_cursors:
+            return None
+        seen_cursors.add(str(cursor))
+        return get_user_recently_played(
+            access_token, int(cursor), direction=direction, limit=limit
+        )
+
+    first = get_user_recently_played(
+        access_token, timestamp, direction=direction, limit=limit
+    )
+    return paginate(first, next_response, max_items)
 
 
 def get_track_audio_features(
-    access_token: str,
+    access_token: AccessToken,
     track_id: str,
 ):
     """Get audio features for a single track identified by its unique Spotify ID.
@@ -170,11 +575,11 @@ def get_track_audio_features(
     track_id : str
         Track's ID.
     """
-    return spotify_get(access_token, f"/audio-features/{track_id}")
+    return get_client().get_track_audio_features(access_token, track_id)
 
 
 def get_several_tracks_audio_features(
-    access_token: str,
+    access_token: AccessToken,
     track_ids: Sequence[str],
 ):
     """Get audio features for multiple tracks based on their Spotify IDs.
@@ -186,4 +591,4 @@ def get_several_tracks_audio_features(
     track_ids : list
         List of track IDs.
     """
-    return spotify_get(access_token, "/audio-features", {"ids": ",".join(track_ids)})
+    return get_client().get_several_tracks_audio_features(access_token, track_ids)
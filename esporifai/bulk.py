@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from collections.abc import Awaitable, Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+
+import httpx
+
+from .aio import AsyncSpotifyClient
+from .api import AccessToken, chunked
+from .config import ClientSettings
+from .serialization import dumps_line, dumps_pretty, loads
+
+# One manifest per endpoint, so runs of different endpoints into the same
+# directory do not mark each other's IDs as done.
+MANIFEST_NAME = ".esporifai-{endpoint}.manifest.jsonl"
+
+Fetch = Callable[[list[str]], Awaitable[dict[str, Any]]]
+
+
+class BulkFetchError(RuntimeError):
+    pass
+
+
+@dataclass
+class BulkSummary:
+    completed: int = 0
+    failed: int = 0
+    skipped: int = 0
+    manifest: str = ""
+
+    def as_dict(self) -> dict:
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "manifest": self.manifest,
+        }
+
+
+class Manifest:
+    """Append-only record of which IDs a bulk run has finished or failed.
+
+    The last entry for an ID wins, so a rerun that retries a failed ID simply
+    appends its new outcome.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.status: dict[str, dict] = {}
+        self._handle = None
+        if path.exists():
+            with open(path) as handle:
+                for line in handle:
+                    try:
+                        entry = loads(line)
+                    except ValueError:
+                        # A run killed mid-write can leave a partial last line.
+                        continue
+                    self.status[entry["id"]] = entry
+
+    def done(self, item_id: str) -> bool:
+        return self.status.get(item_id, {}).get("status") == "ok"
+
+    def record(self, item_id: str, status: str, error: str | None = None) -> None:
+        entry = {"id": item_id, "status": status}
+        if error:
+            entry["error"] = error
+        self.status[item_id] = entry
+        if self._handle is None:
+            self._handle = open(self.path, "a")
+        self._handle.write(dumps_line(entry) + "\n")
+        self._handle.flush()
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+
+def write_json_atomic(path: Path, data: Any) -> None:
+    """Write ``data`` like ``handle_data`` does, replacing ``path`` in one step."""
+    temporary = path.with_name(f".{path.name}.tmp")
+    temporary.write_text(dumps_pretty(data), encoding="utf-8")
+    os.replace(temporary, path)
+
+
+def response_data(response: httpx.Response) -> Any:
+    if response.status_code != 200:
+        raise BulkFetchError(f"Error {response.status_code}: {response.text[:500]}")
+    return loads(response.content)
+
+
+async def run_bulk(
+    ids: Sequence[str],
+    fetch: Fetch,
+    output_dir: Path,
+    *,
+    endpoint: str,
+    workers: int = 1,
+    batch_size: int = 1,
+) -> BulkSummary:
+    """Fetch every ID into ``output_dir/<id>.json`` with a bounded worker pool.
+
+    ``fetch`` receives a batch of up to ``batch_size`` IDs and returns their
+    data keyed by ID; IDs it leaves out or maps to ``None`` are recorded as
+    not found. Failures are written to the manifest instead of aborting, and
+    IDs the manifest already lists as done are skipped, so an interrupted run
+    resumes where it stopped. Each ``endpoint`` keeps its own manifest.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(output_dir / MANIFEST_NAME.format(endpoint=endpoint))
+    summary = BulkSummary(manifest=str(manifest.path))
+
+    pending = []
+    for item_id in dict.fromkeys(ids):
+        if manifest.done(item_id) and (output_dir / f"{item_id}.json").exists():
+            summary.skipped += 1
+        else:
+            pending.append(item_id)
+
+    queue: asyncio.Queue[list[str]] = asyncio.Queue()
+    for batch in chunked(pending, batch_size) if pending else []:
+        queue.put_nowait(batch)
+
+    async def worker() -> None:
+        while not queue.empty():
+            batch = queue.get_nowait()
+            try:
+                results = await fetch(batch)
+            except (BulkFetchError, httpx.HTTPError) as exc:
+                for item_id in batch:
+                    manifest.record(item_id, "error", str(exc))
+                    summary.failed += 1
+                continue
+
+            for item_id in batch:
+                data = results.get(item_id)
+                if data is None:
+                    manifest.record(item_id, "error", "Not found")
+                    summary.failed += 1
+                    continue
+                write_json_atomic(output_dir / f"{item_id}.json", data)
+                manifest.record(item_id, "ok")
+                summary.completed += 1
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(workers, 1))))
+    finally:
+        manifest.close()
+    return summary
+
+
+def bulk_fetch_items(
+    endpoint: str,
+    access_token: AccessToken,
+    ids: Sequence[str],
+    output_dir: Path,
+    *,
+    settings: ClientSettings,
+    workers: int = 1,
+) -> BulkSummary:
+    """Run ``run_bulk`` for a single-ID endpoint method such as ``"get_track"``."""
+
+    async def run() -> BulkSummary:
+        # run_bulk already dedups IDs; a memo would hold every body for minutes.
+        async with AsyncSpotifyClient.from_settings(
+            settings, concurrency=workers, memo_ttl=0
+        ) as client:
+            method = getattr(client, endpoint)
+
+            async def fetch(batch: list[str]) -> dict[str, Any]:
+                (item_id,) = batch
+                return {item_id: response_data(await method(access_token, item_id))}
+
+            return await run_bulk(
+                ids, fetch, output_dir, endpoint=endpoint, workers=workers
+            )
+
+    return asyncio.run(run())
+
+
+def bulk_fetch_several(
+    endpoint: str,
+    key: str,
+    batch_size: int,
+    access_token: AccessToken,
+    ids: Sequence[str],
+    output_dir: Path,
+    *,
+    settings: ClientSettings,
+    workers: int = 1,
+) -> BulkSummary:
+    """Run ``run_bulk`` for a several-ID endpoint method, ``batch_size`` IDs a request.
+
+    ``key`` names the list in the response, e.g. ``"audio_features"``; its
+    entries are split back out into one file per ID.
+    """
+
+    async def run() -> BulkSummary:
+        async with AsyncSpotifyClient.from_settings(
+            settings, concurrency=workers, memo_ttl=0
+        ) as client:
+            method = getattr(client, endpoint)
+
+            async def fetch(batch: list[str]) -> dict[str, Any]:
+                data = response_data(await method(access_token, batch))
+                return dict(zip(batch, data[key]))
+
+            return await run_bulk(
+                ids,
+                fetch,
+                output_dir,
+                endpoint=endpoint,
+                workers=workers,
+                batch_size=batch_size,
+            )
+
+    return asyncio.run(run())
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from collections.abc import Sequence
+from dataclasses import dataclass
+from pathlib import Path
+
+import httpx
+
+from .config import ClientSettings
+from .constants import APP_DIR
+from .serialization import dumps, loads
+
+CACHE_FILE = APP_DIR.joinpath("cache.sqlite3")
+
+# Seconds a cached catalog response is served without asking Spotify again.
+DEFAULT_TTLS = {
+    "tracks": 7 * 24 * 3600,
+    "artists": 24 * 3600,
+    "audio-features": 30 * 24 * 3600,
+    "audio-analysis": 30 * 24 * 3600,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    endpoint TEXT NOT NULL,
+    id TEXT NOT NULL,
+    body TEXT NOT NULL,
+    etag TEXT,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (endpoint, id)
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    body: str
+    etag: str | None
+    expires_at: float
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def response(self) -> httpx.Response:
+        return httpx.Response(
+            200,
+            content=self.body.encode("utf-8"),
+            headers={"Content-Type": "application/json", "X-Esporifai-Cache": "hit"},
+        )
+
+
+class ResponseCache:
+    """SQLite store of catalog responses keyed by endpoint and Spotify ID.
+
+    Entries expire after a per-endpoint TTL; stale entries that carry an ETag
+    are revalidated with ``If-None-Match`` instead of refetched. Once the
+    stored bodies exceed ``max_bytes`` the least recently used are evicted.
+    """
+
+    def __init__(
+        self,
+        path: Path = CACHE_FILE,
+        *,
+        max_bytes: int = 512 * 1024 * 1024,
+        ttls: dict[str, float] | None = None,
+    ):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._size = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    @classmethod
+    def from_settings(cls, settings: ClientSettings) -> ResponseCache | None:
+        if not settings.cache_enabled:
+            return None
+        return cls(
+            max_bytes=settings.cache_max_bytes,
+            ttls=settings.cache_ttls,
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def get(self, endpoint: str, item_id: str) -> CacheEntry | None:
+        return self.get_many(endpoint, [item_id]).get(item_id)
+
+    def get_many(self, endpoint: str, ids: Sequence[str]) -> dict[str, CacheEntry]:
+        unique = list(dict.fromkeys(ids))
+        entries = {}
+        with self._lock:
+            for start in range(0, len(unique), 500):
+                chunk = unique[start : start + 500]
+                rows = self._db.execute(
+                    "SELECT id, body, etag, expires_at FROM responses "
+                    f"WHERE endpoint = ? AND id IN ({','.join('?' * len(chunk))})",
+                    [endpoint, *chunk],
+                )
+                for item_id, body, etag, expires_at in rows:
+                    entries[item_id] = CacheEntry(body, etag, expires_at)
+
+            if entries:
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE responses SET accessed_at = ? "
+                    "WHERE endpoint = ? AND id = ?",
+                    [(now, endpoint, item_id) for item_id in entries],
+                )
+                self._db.commit()
+        return entries
+
+    def put(self, endpoint: str, item_id: str, body: str, etag: str | None = None):
+        self.put_many(endpoint, [(item_id, body, etag)])
+
+    def put_many(
+        self, endpoint: str, items: Sequence[tuple[str, str, str | None]]
+    ) -> None:
+        now = time.time()
+        expires_at = now + self.ttls.get(endpoint, 0)
+        with self._lock:
+            for item_id, body, _ in items:
+                previous = self._db.execute(
+                    "SELECT size FROM responses WHERE endpoint = ? AND id = ?",
+                    (endpoint, item_id),
+                ).fetchone()
+                self._size += len(body) - (previous[0] if previous else 0)
+            self._db.executemany(
+                "INSERT OR REPLACE INTO responses "
+                "(endpoint, id, body, etag, expires_at, accessed_at, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (endpoint, item_id, body, etag, expires_at, now, len(body))
+                    for item_id, body, etag in items
+                ],
+            )
+            self._db.commit()
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def refresh(self, endpoint: str, item_id: str) -> None:
+        """Extend an entry's lifetime after Spotify confirmed it is unchanged."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE responses SET expires_at = ?, accessed_at = ? "
+                "WHERE endpoint = ? AND id = ?",
+                (now + self.ttls.get(endpoint, 0), now, endpoint, item_id),
+            )
+            self._db.commit()
+
+    def _evict(self) -> None:
+        self._size = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        target = self._size - int(self.max_bytes * 0.9)
+        if target <= 0:
+            return
+
+        freed = 0
+        victims = []
+        rows = self._db.execute(
+            "SELECT endpoint, id, size FROM responses ORDER BY accessed_at"
+        )
+        for endpoint, item_id, size in rows:
+            victims.append((endpoint, item_id))
+            freed += size
+            if freed >= target:
+                break
+
+        self._db.executemany(
+            "DELETE FROM responses WHERE endpoint = ? AND id = ?", victims
+        )
+        self._db.commit()
+        self._size -= freed
+
+
+def conditional_headers(entry: CacheEntry | None) -> dict | None:
+    if entry is not None and entry.etag:
+        return {"If-None-Match": entry.etag}
+    return None
+
+
+def store_response(
+    cache: ResponseCache,
+    endpoint: str,
+    item_id: str,
+    response: httpx.Response,
+    entry: CacheEntry | None,
+) -> httpx.Response:
+    """Record a single-item response and return what the caller should see."""
+    if response.status_code == 304 and entry is not None:
+        cache.refresh(endpoint, item_id)
+        return entry.response()
+    if response.status_code == 200:
+        cache.put(endpoint, item_id, response.text, response.headers.get("ETag"))
+    return response
+
+
+class CachedBatch:
+    """Splits a several-ID request into cache hits and unique IDs still to fetch.
+
+    Without a cache every ID is a miss, but duplicates are still requested once.
+    """
+
+    def __init__(
+        self,
+        cache: ResponseCache | None,
+        endpoint: str,
+        key: str,
+        ids: Sequence[str],
+    ):
+        self.cache = cache
+        self.endpoint = endpoint
+        self.key = key
+        self.ids = list(ids)
+        entries = cache.get_many(endpoint, self.ids) if cache is not None else {}
+        self.items = {
+            item_id: loads(entry.body)
+            for item_id, entry in entries.items()
+            if entry.fresh
+        }
+        self.misses = [
+            item_id for item_id in dict.fromkeys(self.ids) if item_id not in self.items
+        ]
+
+    def fill(self, response: httpx.Response) -> None:
+        fetched = []
+        for item_id, item in zip(self.misses, loads(response.content)[self.key]):
+            self.items[item_id] = item
+            if item is not None:
+                fetched.append((item_id, dumps(item), None))
+        if fetched and self.cache is not None:
+            self.cache.put_many(self.endpoint, fetched)
+
+    def response(self) -> httpx.Response:
+        return httpx.Response(
+            200, json={self.key: [self.items.get(item_id) for item_id in self.ids]}
+        )
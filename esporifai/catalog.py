@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import copy
+import heapq
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+from .compression import COMPRESSED_SUFFIXES
+from .history import (
+    Json,
+    finalize_record,
+    iter_history_rows,
+    jsonl_line,
+    merge_record,
+    sorted_lines,
+    write_lines,
+)
+from .serialization import dumps, loads
+
+INDEX_SUFFIX = ".idx"
+
+
+@dataclass
+class CatalogMergeResult:
+    added: int = 0
+    updated: int = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.updated)
+
+    def as_dict(self) -> dict:
+        return {"added": self.added, "updated": self.updated}
+
+
+class CatalogIndex:
+    """Sidecar file mapping the record IDs of a catalog to their byte offsets.
+
+    The index remembers the size, mtime and inode of the catalog it describes
+    and is rebuilt with one scan whenever the catalog changed behind its back.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.index_path = path.with_name(path.name + INDEX_SUFFIX)
+
+    def _stamp(self) -> list[int]:
+        stat = os.stat(self.path)
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+    def load(self) -> dict[str, int]:
+        try:
+            index = loads(self.index_path.read_bytes())
+            if index.get("stamp") == self._stamp():
+                return index["offsets"]
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        return self.rebuild()
+
+    def rebuild(self) -> dict[str, int]:
+        offsets = {}
+        position = 0
+        with open(self.path, "rb") as handle:
+            for line in handle:
+                if line.strip():
+                    offsets[loads(line)["id"]] = position
+                position += len(line)
+        self.save(offsets)
+        return offsets
+
+    def save(self, offsets: dict[str, int]) -> None:
+        temporary = self.index_path.with_name(f".{self.index_path.name}.tmp")
+        temporary.write_text(
+            dumps({"stamp": self._stamp(), "offsets": offsets}), encoding="utf-8"
+        )
+        os.replace(temporary, self.index_path)
+
+
+def merge_catalog(path: Path, records: dict[str, Json]) -> CatalogMergeResult:
+    """Merge ``records`` into the catalog at ``path`` with ``merge_record`` rules.
+
+    Existing records are looked up through the offset index, so only the IDs
+    in ``records`` are parsed. The file is rewritten only when a record was
+    added or changed; unchanged lines are copied byte for byte.
+    """
+    if path.suffix in COMPRESSED_SUFFIXES:
+        return _merge_compressed_catalog(path, records)
+
+    result = CatalogMergeResult()
+    if not path.exists():
+        result.added = len(records)
+        if records:
+            write_lines(path, sorted_lines(records))
+            CatalogIndex(path).rebuild()
+        return result
+
+    index = CatalogIndex(path)
+    offsets = index.load()
+    updates: dict[str, bytes] = {}
+    with open(path, "rb") as handle:
+        for record_id, record in records.items():
+            offset = offsets.get(record_id)
+            if offset is None:
+                merged: dict[str, Json] = {}
+                merge_record(merged, record)
+                finalize_record(merged[record_id])
+                updates[record_id] = jsonl_line(merged[record_id]).encode("utf-8")
+                result.added += 1
+                continue
+
+            handle.seek(offset)
+            line = handle.readline()
+            current = loads(line)
+            merged = {record_id: loads(line)}
+            merge_record(merged, record)
+            if finalize_record(merged[record_id]) != current:
+                updates[record_id] = jsonl_line(merged[record_id]).encode("utf-8")
+                result.updated += 1
+
+    if updates:
+        _rewrite_catalog(index, offsets, updates)
+    return result
+
+
+def _rewrite_catalog(
+    index: CatalogIndex, offsets: dict[str, int], updates: dict[str, bytes]
+) -> None:
+    path = index.path
+    existing = sorted(offsets, key=offsets.__getitem__)
+    added = sorted(set(updates) - offsets.keys())
+    new_offsets = {}
+    position = 0
+    temporary = path.with_name(f".{path.name}.tmp")
+    with open(path, "rb") as source, open(temporary, "wb", buffering=1 << 20) as target:
+        # Catalogs are written sorted by ID, so file order merges with new IDs.
+        for record_id in heapq.merge(existing, added):
+            if record_id in offsets:
+                if source.tell() != offsets[record_id]:
+                    source.seek(offsets[record_id])
+                line = updates.get(record_id, source.readline())
+            else:
+                line = updates[record_id]
+            target.write(line)
+            new_offsets[record_id] = position
+            position += len(line)
+    os.replace(temporary, path)
+    index.save(new_offsets)
+
+
+def _merge_compressed_catalog(
+    path: Path, records: dict[str, Json]
+) -> CatalogMergeResult:
+    """Compressed catalogs cannot be read by offset, so merge them in memory."""
+    result = CatalogMergeResult()
+    existing: dict[str, Json] = {}
+    if path.exists():
+        existing = {row["id"]: row for row in iter_history_rows(path)}
+
+    for record_id, record in records.items():
+        current = existing.get(record_id)
+        if current is None:
+            result.added += 1
+            merge_record(existing, record)
+            finalize_record(existing[record_id])
+            continue
+        before = copy.deepcopy(current)
+        merge_record(existing, record)
+        if finalize_record(existing[record_id]) != before:
+            result.updated += 1
+
+    if result.changed:
+        write_lines(path, sorted_lines(existing))
+    return result
@@ -1,57 +1,74 @@
 from __future__ import annotations
 
-from pathlib import Path
 from datetime import datetime as dt
-import json
+from pathlib import Path
 from typing import List, Optional
 from zoneinfo import ZoneInfo
 
+import httpx
 import typer
 from rich import print
 
-from .config import get_authorize_url_inputs, get_settings
+from .aio import run_each
 from .api import (
-    get_track_audio_analysis,
-    get_user_top_items,
-    get_user_recently_played,
+    SEVERAL_AUDIO_FEATURES_LIMIT,
+    AccessToken,
+    chunked,
     get_artist,
     get_several_artists,
-    get_track,
     get_several_tracks,
-    get_track_audio_features,
     get_several_tracks_audio_features,
+    get_track,
+    get_track_audio_analysis,
+    get_track_audio_features,
+    get_user_recently_played,
+    get_user_top_items,
+    iter_user_recently_played,
+    iter_user_top_items,
 )
+from .bulk import bulk_fetch_items, bulk_fetch_several
+from .catalog import merge_catalog
+from .config import get_authorize_url_inputs, get_client_settings, get_settings
 from .constants import (
     APP_DIR,
+    AUTH_FILE,
+    GetRecentlyPlayedDirections,
     GetTopItems,
     GetTopTimeRanges,
-    GetRecentlyPlayedDirections,
-    __version__,
     __app_name__,
+    __version__,
+)
+from .history import (
+    DEFAULT_SORT_BUFFER,
+    EventLogMerge,
+    HistoryInputKind,
+    history_input_files,
+    jsonl_line,
+    normalize_history_files,
+    sorted_lines,
+    write_lines,
 )
+from .serialization import dumps, dumps_pretty
+from .store import STORE_FILE, HistoryStore
+from .sync import sync_recently_played
+from .tokens import TokenManager
 from .utils import (
     auth_check,
     build_auth_code_url,
     build_auth_payload,
     get_auth_status,
     handle_authorization,
+    handle_data,
     handle_id_file,
     handle_response,
-    handle_data,
+    listen_for_code,
     request_token,
+    stream_items,
     write_json,
 )
-from .constants import AUTH_FILE
-from .history import (
-    HistoryInputKind,
-    load_json,
-    normalize_history_payload,
-    sorted_jsonl,
-    write_jsonl,
-)
-
 
 token_info = None
+token_manager: Optional[TokenManager] = None
 
 
 def init():
@@ -62,17 +79,140 @@ def init():
 cli = typer.Typer(callback=init, help=f"""{__app_name__} version {__version__}""")
 
 
+def get_token_manager() -> TokenManager:
+    global token_manager
+    if token_manager is None:
+        token_manager = TokenManager(get_settings(), authorize=handle_authorization)
+    return token_manager
+
+
 def ensure_token_info(force: bool = False):
     global token_info
-    if force or token_info is None:
-        token_info = handle_authorization(
-            save_files=True,
-            force=force,
-            settings=get_settings(),
-        )
+    token_info = get_token_manager().token_info(force=force)
     return token_info
 
 
+def ensure_access_token() -> AccessToken:
+    """Authorize now and return a token callable the clients call per request."""
+    ensure_token_info()
+    return get_token_manager().access_token
+
+
+def reject_trim_when_streaming(trim: bool):
+    # Streamed output is always the bare items array, so --trim would be a no-op.
+    if trim:
+        raise typer.BadParameter(
+            "--trim cannot be combined with --all or --max-items, which always "
+            "write the items array.",
+            param_hint="'--trim'",
+        )
+
+
+def stream_pages(items, output: Path):
+    try:
+        stream_items(items, output)
+    except httpx.HTTPStatusError as exc:
+        handle_response(exc.response)
+
+
+def write_id_output(data, _id: str, output: Path):
+    if output == Path("-"):
+        typer.echo(
+            dumps(
+                data,
+                default=str,
+            )
+        )
+    elif output.is_dir():
+        handle_data(data, output.joinpath(f"{_id}.json"))
+    else:
+        handle_data(data, Path(f"{_id}.json"))
+
+
+def dispatch(
+    endpoint: str,
+    fetch,
+    access_token: AccessToken,
+    keys: list,
+    callback,
+    concurrency: int,
+):
+    """Call ``fetch(access_token, key)`` for every key and pass results to ``callback``.
+
+    Keys are IDs or chunks of IDs. Results arrive in order; with
+    ``concurrency`` above one the requests run on the async client.
+    """
+    if concurrency > 1:
+        run_each(
+            endpoint,
+            access_token,
+            keys,
+            callback,
+            settings=get_client_settings(),
+            concurrency=concurrency,
+        )
+    else:
+        for key in keys:
+            callback(key, fetch(access_token, key))
+
+
+def fetch_id_file(
+    endpoint: str,
+    fetch,
+    access_token: AccessToken,
+    ids: List[str],
+    output: Path,
+    concurrency: int = 1,
+):
+    def write(_id: str, response):
+        write_id_output(handle_response(response), _id, output)
+
+    # Repeated IDs are answered by the client without new requests; files only
+    # need writing once, while stdout still gets one line per input ID.
+    if output != Path("-"):
+        ids = list(dict.fromkeys(ids))
+
+    dispatch(endpoint, fetch, access_token, ids, write, concurrency)
+
+
+def bulk_id_file(
+    endpoint: str, access_token: AccessToken, ids: List[str], output: Path, workers: int
+):
+    summary = bulk_fetch_items(
+        endpoint,
+        access_token,
+        ids,
+        output if output.is_dir() else Path("."),
+        settings=get_client_settings(),
+        workers=workers,
+    )
+    report_bulk(summary)
+
+
+def report_bulk(summary):
+    typer.echo(dumps(summary.as_dict(), sort_keys=True))
+    if summary.failed:
+        raise typer.Exit(code=1)
+
+
+def stream_audio_features(access_token: AccessToken, ids: List[str], concurrency: int):
+    """Print one audio-features line per ID, fetching up to 100 IDs a request."""
+
+    def write(chunk: List[str], response):
+        items = handle_response(response)["audio_features"]
+        for _id, item in zip(chunk, items):
+            write_id_output(item, _id, Path("-"))
+
+    dispatch(
+        "get_several_tracks_audio_features",
+        get_several_tracks_audio_features,
+        access_token,
+        chunked(ids, SEVERAL_AUDIO_FEATURES_LIMIT) if ids else [],
+        write,
+        concurrency,
+    )
+
+
 @cli.command()
 def auth(
     force: bool = typer.Option(False, "--force", help="Force authorization flow"),
@@ -90,13 +230,24 @@ def auth(
         "--code",
         help="Exchange a Spotify authorization code without browser automation.",
     ),
+    listen: bool = typer.Option(
+        False,
+        "--listen",
+        help="Serve REDIRECT_URI locally and exchange the code Spotify sends to it.",
+    ),
+    listen_timeout: float = typer.Option(
+        300.0, "--listen-timeout", help="Seconds to wait for the redirect.", min=1
+    ),
+    open_browser: bool = typer.Option(
+        False, "--open", help="Open the authorization URL with --listen."
+    ),
 ):
     if check:
         print(auth_check())
         return None
 
     if status:
-        print(json.dumps(get_auth_status(), indent=2, default=str))
+        print(dumps_pretty(get_auth_status()))
         return None
 
     if url:
@@ -104,13 +255,17 @@ def auth(
         print(build_auth_code_url(client_id=client_id, redirect_uri=redirect_uri))
         return None
 
+    if listen:
+        code = listen_for_code(timeout=listen_timeout, open_browser=open_browser)
+
     if code:
         settings = get_settings()
         write_json(AUTH_FILE, build_auth_payload(code, settings=settings))
         token = request_token(code, write=True, settings=settings)
         global token_info
         token_info = token
-        print(json.dumps(get_auth_status(settings=settings), indent=2, default=str))
+        get_token_manager().set(token)
+        print(dumps_pretty(get_auth_status(settings=settings)))
         return None
 
     ensure_token_info(force=force)
@@ -141,12 +296,42 @@ def get_top(
         help="File to write output to.",
         allow_dash=True,
     ),
-    trim: bool = typer.Option(False, "--trim/--full"),
+    trim: bool = typer.Option(
+        False,
+        "--trim/--full",
+        help="Write only the items array. Not allowed with --all or --max-items.",
+    ),
+    all_items: bool = typer.Option(
+        False,
+        "--all",
+        help="Follow pagination and stream every item to --output as it arrives.",
+    ),
+    max_items: Optional[int] = typer.Option(
+        None,
+        "--max-items",
+        min=1,
+        help="Follow pagination and stop after this many items. Implies --all.",
+    ),
 ):
-    token_info = ensure_token_info()
+    access_token = ensure_access_token()
+    if all_items or max_items:
+        reject_trim_when_streaming(trim)
+        stream_pages(
+            iter_user_top_items(
+                access_token=access_token,
+                item_type=item_type.value,
+                limit=limit,
+                offset=offset,
+                time_range=f"{time_range.value}_term",
+                max_items=max_items,
+            ),
+            output,
+        )
+        return None
+
     response = handle_response(
         get_user_top_items(
-            access_token=token_info["access_token"],
+            access_token=access_token,
             item_type=item_type.value,
             limit=limit,
             offset=offset,
@@ -157,7 +342,7 @@ def get_top(
     data = handle_data(response, output, trim)
 
     if output == Path("-"):
-        print(json.dumps(data, default=str))
+        print(dumps(data, default=str))
 
 
 @cli.command()
@@ -181,16 +366,45 @@ def get_recently_played(
         help="File to write output to.",
         allow_dash=True,
     ),
-    trim: bool = typer.Option(False, "--trim/--full"),
+    trim: bool = typer.Option(
+        False,
+        "--trim/--full",
+        help="Write only the items array. Not allowed with --all or --max-items.",
+    ),
+    all_items: bool = typer.Option(
+        False,
+        "--all",
+        help="Follow pagination and stream every item to --output as it arrives.",
+    ),
+    max_items: Optional[int] = typer.Option(
+        None,
+        "--max-items",
+        min=1,
+        help="Follow pagination and stop after this many items. Implies --all.",
+    ),
 ):
-    token_info = ensure_token_info()
+    access_token = ensure_access_token()
     # transform date from timestamp to unix timestamp in milliseconds
     timestamp = timestamp.replace(tzinfo=ZoneInfo(time_zone))
     timestamp = int(timestamp.timestamp()) * 1_000
 
+    if all_items or max_items:
+        reject_trim_when_streaming(trim)
+        stream_pages(
+            iter_user_recently_played(
+                access_token=access_token,
+                timestamp=timestamp,
+                direction=direction.value,
+                limit=limit,
+                max_items=max_items,
+            ),
+            output,
+        )
+        return None
+
     response = handle_response(
         get_user_recently_played(
-            access_token=token_info["access_token"],
+            access_token=access_token,
             timestamp=timestamp,
             direction=direction,
             limit=limit,
@@ -200,7 +414,29 @@ def get_recently_played(
     data = handle_data(response, output, trim)
 
     if output == Path("-"):
-        print(json.dumps(data, default=str))
+        print(dumps(data, default=str))
+
+
+@cli.command()
+def sync_recent(
+    output: Path = typer.Option(
+        "recently_played.jsonl",
+        "--output",
+        "-o",
+        help="Append-only JSONL file that new plays are added to.",
+    ),
+):
+    """Append plays made since the last sync to an append-only JSONL file."""
+    access_token = ensure_access_token()
+    try:
+        summary = sync_recently_played(
+            access_token=access_token,
+            user_id=get_settings().user_id,
+            output=output,
+        )
+    except httpx.HTTPStatusError as exc:
+        handle_response(exc.response)
+    typer.echo(dumps(summary, sort_keys=True))
 
 
 @cli.command()
@@ -208,14 +444,13 @@ def normalize_history(
     kind: HistoryInputKind = typer.Argument(
         ..., case_sensitive=False, help="Input shape to normalize."
     ),
-    input_path: Path = typer.Option(
+    input_path: str = typer.Option(
         ...,
         "--input",
         "-i",
-        exists=True,
-        dir_okay=False,
-        readable=True,
-        help="JSON file to read.",
+        help=(
+            "JSON or JSONL file, directory, or glob pattern to read. Use '-' for stdin."
+        ),
     ),
     output: Path = typer.Option(
         Path("-"),
@@ -234,20 +469,148 @@ def normalize_history(
         "--catalog-dir",
         help="Optional directory for track, album, and artist catalog JSONL files.",
     ),
+    workers: Optional[int] = typer.Option(
+        None,
+        "--workers",
+        "-w",
+        min=1,
+        help="Processes to parse input files with. Defaults to the CPU count.",
+    ),
+    catalog_suffix: str = typer.Option(
+        ".jsonl",
+        "--catalog-suffix",
+        help="Suffix for catalog files. Use .jsonl.gz or .jsonl.zst to compress them.",
+    ),
+    compact: bool = typer.Option(
+        False,
+        "--compact",
+        help="Store events column-wise to use less memory on very large histories.",
+    ),
+    merge: bool = typer.Option(
+        False,
+        "--merge",
+        help="Merge into the existing catalog files instead of replacing them.",
+    ),
+    sort_buffer: int = typer.Option(
+        DEFAULT_SORT_BUFFER,
+        "--sort-buffer",
+        min=1,
+        help="Records to sort in memory before spilling sorted runs to disk.",
+    ),
 ):
-    payload = load_json(input_path)
-    history = normalize_history_payload(payload, kind, source)
+    if merge and catalog_dir is None:
+        raise typer.BadParameter(
+            "--merge requires --catalog-dir.", param_hint="'--merge'"
+        )
 
-    if output == Path("-"):
-        typer.echo(sorted_jsonl(history.event_records()), nl=False)
-    else:
-        write_jsonl(output, history.event_records())
-        typer.echo(json.dumps(history.as_summary(), sort_keys=True))
+    input_files = history_input_files(input_path)
+    if not input_files:
+        raise typer.BadParameter(
+            f"No input files found for {input_path!r}.", param_hint="'--input'"
+        )
+    history = normalize_history_files(input_files, kind, source, workers, compact)
+
+    history.finalize()
+    write_lines(output, sorted_lines(history.events, sort_buffer))
+    summary = history.as_summary()
 
     if catalog_dir is not None:
-        write_jsonl(catalog_dir / "track_catalog.jsonl", history.track_records())
-        write_jsonl(catalog_dir / "album_catalog.jsonl", history.album_records())
-        write_jsonl(catalog_dir / "artist_catalog.jsonl", history.artist_records())
+        for name, records in (
+            ("track", history.tracks),
+            ("album", history.albums),
+            ("artist", history.artists),
+        ):
+            path = catalog_dir / f"{name}_catalog{catalog_suffix}"
+            if merge:
+                result = merge_catalog(path, records)
+                summary.setdefault("catalogs", {})[name] = result.as_dict()
+            else:
+                write_lines(path, sorted_lines(records, sort_buffer))
+
+    if output != Path("-"):
+        typer.echo(dumps(summary, sort_keys=True))
+
+
+@cli.command()
+def merge_history(
+    inputs: List[Path] = typer.Argument(
+        ...,
+        exists=True,
+        dir_okay=False,
+        readable=True,
+        help="Normalized event JSONL files, each sorted by played_at and track_id.",
+    ),
+    output: Path = typer.Option(
+        Path("-"),
+        "--output",
+        "-o",
+        help="JSONL file to write merged events to. Use '-' for stdout.",
+        allow_dash=True,
+    ),
+):
+    """Merge sorted event logs into one, combining the sources of duplicates."""
+    merged = EventLogMerge(inputs)
+    try:
+        write_lines(output, map(jsonl_line, merged))
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc), param_hint="'INPUTS'") from exc
+
+    if output != Path("-"):
+        summary = {
+            "inputs": len(inputs),
+            "events": merged.events,
+            "duplicates": merged.duplicates,
+        }
+        typer.echo(dumps(summary, sort_keys=True))
+
+
+store_app = typer.Typer(help="Load normalized history into a local SQLite store.")
+cli.add_typer(store_app, name="store")
+
+
+@store_app.command("ingest")
+def store_ingest(
+    kind: HistoryInputKind = typer.Argument(
+        ..., case_sensitive=False, help="Input shape to normalize."
+    ),
+    input_path: str = typer.Option(
+        ...,
+        "--input",
+        "-i",
+        help=(
+            "JSON or JSONL file, directory, or glob pattern to read. Use '-' for stdin."
+        ),
+    ),
+    database: Path = typer.Option(
+        STORE_FILE,
+        "--database",
+        "-d",
+        help="SQLite database to upsert events and catalogs into.",
+    ),
+    source: str = typer.Option(
+        "spotify_history",
+        "--source",
+        help="Source label to store on normalized records.",
+    ),
+    workers: Optional[int] = typer.Option(
+        None,
+        "--workers",
+        "-w",
+        min=1,
+        help="Processes to parse input files with. Defaults to the CPU count.",
+    ),
+):
+    """Normalize history inputs and upsert them into the SQLite store."""
+    input_files = history_input_files(input_path)
+    if not input_files:
+        raise typer.BadParameter(
+            f"No input files found for {input_path!r}.", param_hint="'--input'"
+        )
+    history = normalize_history_files(input_files, kind, source, workers)
+    with HistoryStore(database) as store:
+        changed = store.ingest(history)
+    summary = {**history.as_summary(), "changed": changed.as_dict()}
+    typer.echo(dumps(summary, sort_keys=True))
 
 
 @cli.command()
@@ -268,12 +631,19 @@ def analyze_track(
         "-f",
         help="A newline-delimited file with a list of track IDs. One per line.",
     ),
+    concurrency: int = typer.Option(
+        1,
+        "--concurrency",
+        "-c",
+        min=1,
+        help="Number of requests to run concurrently when reading IDs from --file.",
+    ),
 ):
-    token_info = ensure_token_info()
+    access_token = ensure_access_token()
     if track_id != "-":
         response = handle_response(
             get_track_audio_analysis(
-                access_token=token_info["access_token"],
+                access_token=access_token,
                 track_id=track_id,
             )
         )
@@ -282,7 +652,7 @@ def analyze_track(
 
         if output == Path("-"):
             typer.echo(
-                json.dumps(
+                dumps(
                     data,
                     default=str,
                 )
@@ -290,26 +660,23 @@ def analyze_track(
     else:
         if (file.suffix == ".txt") | (file.suffix == ".csv"):
             ids = handle_id_file(file)
-            for _id in ids:
-                response = handle_response(
-                    get_track_audio_analysis(
-                        access_token=token_info["access_token"],
-                        track_id=_id,
-                    )
+            if output == Path("-"):
+                fetch_id_file(
+                    "get_track_audio_analysis",
+                    get_track_audio_analysis,
+                    access_token,
+                    ids,
+                    output,
+                    concurrency,
+                )
+            else:
+                bulk_id_file(
+                    "get_track_audio_analysis",
+                    access_token,
+                    ids,
+                    output,
+                    concurrency,
                 )
-                if output == Path("-"):
-                    data = handle_data(response, output)
-                    typer.echo(
-                        json.dumps(
-                            data,
-                            default=str,
-                        )
-                    )
-                else:
-                    if output.is_dir():
-                        data = handle_data(response, output.joinpath(f"{_id}.json"))
-                    else:
-                        data = handle_data(response, Path(f"{_id}.json"))
         else:
             print("Provide a .txt or .csv file with one ID per line.")
 
@@ -328,18 +695,18 @@ def get_artists(
         allow_dash=True,
     ),
 ):
-    token_info = ensure_token_info()
+    access_token = ensure_access_token()
     if len(artists_ids) == 1:
         response = handle_response(
             get_artist(
-                access_token=token_info["access_token"],
+                access_token=access_token,
                 artist_id=artists_ids[0],
             )
         )
     else:
         response = handle_response(
             get_several_artists(
-                access_token=token_info["access_token"],
+                access_token=access_token,
                 artist_ids=artists_ids,
             )
         )
@@ -348,7 +715,7 @@ def get_artists(
 
     if output == Path("-"):
         typer.echo(
-            json.dumps(
+            dumps(
                 data,
                 default=str,
             )
@@ -369,18 +736,18 @@ def get_tracks(
         allow_dash=True,
     ),
 ):
-    token_info = ensure_token_info()
+    access_token = ensure_access_token()
     if len(track_ids) == 1:
         response = handle_response(
             get_track(
-                access_token=token_info["access_token"],
+                access_token=access_token,
                 track_id=track_ids[0],
             )
         )
     else:
         response = handle_response(
             get_several_tracks(
-                access_token=token_info["access_token"],
+                access_token=access_token,
                 track_ids=track_ids,
             )
         )
@@ -389,7 +756,7 @@ def get_tracks(
 
     if output == Path("-"):
         typer.echo(
-            json.dumps(
+            dumps(
                 data,
                 default=str,
             )
@@ -417,20 +784,27 @@ def get_audio_features(
         "-f",
         help="A newline-delimited file with a list of track IDs. One per line.",
     ),
+    concurrency: int = typer.Option(
+        1,
+        "--concurrency",
+        "-c",
+        min=1,
+        help="Number of requests to run concurrently when reading IDs from --file.",
+    ),
 ):
-    token_info = ensure_token_info()
+    access_token = ensure_access_token()
     if track_ids[0] != "-":
         if len(track_ids) == 1:
             response = handle_response(
                 get_track_audio_features(
-                    access_token=token_info["access_token"],
+                    access_token=access_token,
                     track_id=track_ids[0],
                 )
             )
         else:
             response = handle_response(
                 get_several_tracks_audio_features(
-                    access_token=token_info["access_token"],
+                    access_token=access_token,
                     track_ids=track_ids,
                 )
             )
@@ -439,7 +813,7 @@ def get_audio_features(
 
         if output == Path("-"):
             typer.echo(
-                json.dumps(
+                dumps(
                     data,
                     default=str,
                 )
@@ -447,26 +821,20 @@ def get_audio_features(
     else:
         if (file.suffix == ".txt") | (file.suffix == ".csv"):
             ids = handle_id_file(file)
-            for _id in ids:
-                response = handle_response(
-                    get_track_audio_features(
-                        access_token=token_info["access_token"],
-                        track_id=_id,
-                    )
+            if output == Path("-"):
+                stream_audio_features(access_token, ids, concurrency)
+            else:
+                summary = bulk_fetch_several(
+                    "get_several_tracks_audio_features",
+                    "audio_features",
+                    SEVERAL_AUDIO_FEATURES_LIMIT,
+                    access_token,
+                    ids,
+                    output if output.is_dir() else Path("."),
+                    settings=get_client_settings(),
+                    workers=concurrency,
                 )
-                if output == Path("-"):
-                    data = handle_data(response, output)
-                    typer.echo(
-                        json.dumps(
-                            data,
-                            default=str,
-                        )
-                    )
-                else:
-                    if output.is_dir():
-                        data = handle_data(response, output.joinpath(f"{_id}.json"))
-                    else:
-                        data = handle_data(response, Path(f"{_id}.json"))
+                report_bulk(summary)
         else:
             print("Provide a .txt or .csv file with one ID per line.")
 
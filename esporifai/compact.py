@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import heapq
+import re
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterator, Mapping
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+Json = dict[str, Any]
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Canonical Spotify timestamps: second precision, or exactly three fraction digits.
+CANONICAL_PLAYED_AT = re.compile(
+    r"(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d{3}))?Z"
+)
+
+# Low 11 bits of an encoded timestamp: bit 10 marks the second-precision form,
+# bits 0-9 hold milliseconds. ".mmmZ" sorts before "Z" as strings, so giving
+# it the smaller flag keeps integer order identical to string order.
+SECOND_FORMAT = 1 << 10
+TIME_BITS = 11
+MAX_SOURCES = 64
+
+
+@lru_cache(maxsize=1 << 16)
+def _day_seconds(day: str) -> int | None:
+    try:
+        moment = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+    return (moment - EPOCH) // timedelta(seconds=1)
+
+
+@lru_cache(maxsize=1 << 16)
+def _day_stamp(days: int) -> str:
+    day = EPOCH + timedelta(days=days)
+    return f"{day.year:04d}-{day.month:02d}-{day.day:02d}"
+
+
+def encode_played_at(played_at: str) -> int | None:
+    """Encode a canonical ``played_at`` string as an order-preserving integer.
+
+    Returns ``None`` for anything that would not round-trip exactly.
+    """
+    match = CANONICAL_PLAYED_AT.fullmatch(played_at)
+    if match is None:
+        return None
+    day = _day_seconds(played_at[:10])
+    hour, minute, second = int(match[4]), int(match[5]), int(match[6])
+    if day is None or hour > 23 or minute > 59 or second > 59:
+        return None
+    seconds = day + hour * 3600 + minute * 60 + second
+    millis = match[7]
+    if millis is None:
+        return (seconds << TIME_BITS) | SECOND_FORMAT
+    return (seconds << TIME_BITS) | int(millis)
+
+
+def decode_played_at(value: int) -> str:
+    days, seconds = divmod(value >> TIME_BITS, 86_400)
+    minutes, second = divmod(seconds, 60)
+    hour, minute = divmod(minutes, 60)
+    stamp = f"{_day_stamp(days)}T{hour:02d}:{minute:02d}:{second:02d}"
+    if value & SECOND_FORMAT:
+        return f"{stamp}Z"
+    return f"{stamp}.{value & (SECOND_FORMAT - 1):03d}Z"
+
+
+class CompactEvents(Mapping):
+    """Columnar, dictionary-encoded store of normalized listening events.
+
+    Track IDs and sources are interned; each event is an encoded timestamp,
+    a track number and a source bitmask held in ``array`` columns. Adding an
+    event only appends to the columns. Reading first sorts them by
+    ``(played_at, track_id)`` and folds repeated events into one row, OR-ing
+    their masks, so there is no per-event index. Timestamps that are not
+    canonical are kept in a small dict on the side. The mapping interface
+    matches ``NormalizedHistory.events``: keys are ``(played_at, track_id)``
+    and values are event records, iterated in key order.
+    """
+
+    def __init__(self):
+        self.track_ids: list[str] = []
+        self.track_numbers: dict[str, int] = {}
+        self.sources: list[str] = []
+        self.source_bits: dict[str, int] = {}
+        self.played = array("q")
+        self.tracks = array("L")
+        self.masks = array("Q")
+        self.other: dict[tuple[str, str], int] = {}
+        self._names: dict[int, tuple[str, ...]] = {}
+        # Leading rows that are sorted and unique; rows after it are appended.
+        self._settled = 0
+
+    def __len__(self) -> int:
+        self._settle()
+        return len(self.played) + len(self.other)
+
+    def __iter__(self) -> Iterator[tuple[str, str]]:
+        for key, _ in self._sorted_masks():
+            yield key
+
+    def __getitem__(self, key: tuple[str, str]) -> Json:
+        played_at, track_id = key
+        encoded = encode_played_at(played_at)
+        if encoded is None:
+            return self._record(played_at, track_id, self.other[key])
+        track = self.track_numbers.get(track_id)
+        if track is None:
+            raise KeyError(key)
+        self._settle()
+        row = bisect_left(self.played, encoded)
+        while row < len(self.played) and self.played[row] == encoded:
+            if self.tracks[row] == track:
+                return self._record(played_at, track_id, self.masks[row])
+            row += 1
+        raise KeyError(key)
+
+    def items(self) -> Iterator[tuple[tuple[str, str], Json]]:
+        for key, mask in self._sorted_masks():
+            yield key, self._record(*key, mask)
+
+    def values(self) -> Iterator[Json]:
+        for key, mask in self._sorted_masks():
+            yield self._record(*key, mask)
+
+    def played_at_range(self) -> tuple[str, str] | None:
+        """Earliest and latest ``played_at``, read from the columns unsorted."""
+        bounds = []
+        if self.played:
+            bounds += [
+                decode_played_at(min(self.played)),
+                decode_played_at(max(self.played)),
+            ]
+        if self.other:
+            bounds += [min(self.other)[0], max(self.other)[0]]
+        return (min(bounds), max(bounds)) if bounds else None
+
+    def add(self, played_at: str, track_id: str, source: str) -> None:
+        self.add_mask(played_at, track_id, self._source_bit(source))
+
+    def add_mask(self, played_at: str, track_id: str, mask: int) -> None:
+        encoded = encode_played_at(played_at)
+        if encoded is None:
+            key = (played_at, track_id)
+            self.other[key] = self.other.get(key, 0) | mask
+        else:
+            self._add_encoded(encoded, track_id, mask)
+
+    def _add_encoded(self, encoded: int, track_id: str, mask: int) -> None:
+        track = self.track_numbers.get(track_id)
+        if track is None:
+            track = self.track_numbers[track_id] = len(self.track_ids)
+            self.track_ids.append(track_id)
+        self.played.append(encoded)
+        self.tracks.append(track)
+        self.masks.append(mask)
+        # Fold duplicates once the unsettled tail outgrows the settled rows,
+        # so repeated plays never hold more than about twice the unique rows.
+        if len(self.played) - self._settled > max(self._settled, 1 << 16):
+            self._settle()
+
+    def update(self, other: CompactEvents) -> None:
+        """Merge another table, remapping its track numbers and source bits."""
+        bit_map = [self._source_bit(source) for source in other.sources]
+
+        def remap(mask: int) -> int:
+            result = 0
+            for index, bit in enumerate(bit_map):
+                if mask >> index & 1:
+                    result |= bit
+            return result
+
+        for encoded, track, mask in zip(other.played, other.tracks, other.masks):
+            self._add_encoded(encoded, other.track_ids[track], remap(mask))
+        for (played_at, track_id), mask in other.other.items():
+            self.add_mask(played_at, track_id, remap(mask))
+
+    def _source_bit(self, source: str) -> int:
+        bit = self.source_bits.get(source)
+        if bit is None:
+            if len(self.sources) >= MAX_SOURCES:
+                raise ValueError(
+                    f"Compact history supports at most {MAX_SOURCES} sources"
+                )
+            bit = self.source_bits[source] = 1 << len(self.sources)
+            self.sources.append(source)
+        return bit
+
+    def _source_names(self, mask: int) -> list[str]:
+        # Few distinct masks occur, so each is decoded and sorted only once.
+        names = self._names.get(mask)
+        if names is None:
+            names = self._names[mask] = tuple(
+                sorted(
+                    source
+                    for index, source in enumerate(self.sources)
+                    if mask >> index & 1
+                )
+            )
+        return list(names)
+
+    def _record(self, played_at: str, track_id: str, mask: int) -> Json:
+        return {
+            "played_at": played_at,
+            "track_id": track_id,
+            "sources": self._source_names(mask),
+        }
+
+    def _track_ranks(self) -> list[int]:
+        ranks = [0] * len(self.track_ids)
+        for rank, track in enumerate(
+            sorted(range(len(self.track_ids)), key=self.track_ids.__getitem__)
+        ):
+            ranks[track] = rank
+        return ranks
+
+    def _settle(self) -> None:
+        """Sort the columns by ``(played_at, track_id)`` and fold duplicates."""
+        if self._settled == len(self.played):
+            return
+        ranks = self._track_ranks()
+        if np is not None:
+            self._settle_numpy(ranks)
+        else:
+            self._settle_python(ranks)
+        self._settled = len(self.played)
+
+    def _settle_numpy(self, ranks: list[int]) -> None:
+        played = np.frombuffer(self.played, dtype=np.int64)
+        tracks = np.frombuffer(self.tracks, dtype=f"u{self.tracks.itemsize}")
+        masks = np.frombuffer(self.masks, dtype=np.uint64)
+        track_ranks = np.asarray(ranks, dtype=np.int64)[tracks]
+        order = np.lexsort((track_ranks, played))
+        played, tracks = played[order], tracks[order]
+        masks, track_ranks = masks[order], track_ranks[order]
+
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = played[1:] != played[:-1]
+        first[1:] |= track_ranks[1:] != track_ranks[:-1]
+        starts = np.flatnonzero(first)
+        self.played = _column("q", played[starts])
+        self.tracks = _column("L", tracks[starts])
+        self.masks = _column("Q", np.bitwise_or.reduceat(masks, starts))
+
+    def _settle_python(self, ranks: list[int]) -> None:
+        played, tracks, masks = self.played, self.tracks, self.masks
+        order = sorted(
+            range(len(played)), key=lambda row: (played[row], ranks[tracks[row]])
+        )
+        new_played, new_tracks, new_masks = array("q"), array("L"), array("Q")
+        for row in order:
+            if (
+                new_played
+                and new_played[-1] == played[row]
+                and new_tracks[-1] == tracks[row]
+            ):
+                new_masks[-1] |= masks[row]
+            else:
+                new_played.append(played[row])
+                new_tracks.append(tracks[row])
+                new_masks.append(masks[row])
+        self.played, self.tracks, self.masks = new_played, new_tracks, new_masks
+
+    def _sorted_masks(self) -> Iterator[tuple[tuple[str, str], int]]:
+        self._settle()
+        track_ids = self.track_ids
+        compact = (
+            ((played_at, track_ids[track]), mask)
+            for played_at, track, mask in zip(
+                _decode_column(self.played), self.tracks, self.masks
+            )
+        )
+        other = sorted(self.other.items())
+        if not other:
+            return compact
+        return heapq.merge(compact, other, key=lambda pair: pair[0])
+
+
+def _column(typecode: str, values: Any) -> array:
+    column = array(typecode)
+    column.frombytes(values.astype(f"={typecode}").tobytes())
+    return column
+
+
+def _decode_column(column: array, chunk_size: int = 1 << 16) -> Iterator[str]:
+    """Decode encoded timestamps in order, formatting whole chunks with numpy."""
+    if np is None:
+        yield from map(decode_played_at, column)
+        return
+    for start in range(0, len(column), chunk_size):
+        values = np.asarray(column[start : start + chunk_size], dtype=np.int64)
+        stamps = np.datetime_as_string(
+            (values >> TIME_BITS).astype("datetime64[s]"), unit="s"
+        ).tolist()
+        for stamp, low in zip(stamps, (values & (SECOND_FORMAT * 2 - 1)).tolist()):
+            if low & SECOND_FORMAT:
+                yield f"{stamp}Z"
+            else:
+                yield f"{stamp}.{low:03d}Z"
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import gzip
+from pathlib import Path
+from typing import IO
+
+from .config import ConfigError
+
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+
+
+def data_suffix(path: Path) -> str:
+    """Return the suffix describing the content, e.g. ``.jsonl`` for ``a.jsonl.gz``."""
+    suffixes = path.suffixes
+    if suffixes and suffixes[-1] in COMPRESSED_SUFFIXES:
+        suffixes = suffixes[:-1]
+    return suffixes[-1] if suffixes else ""
+
+
+def _zstd_open(path: Path, mode: str) -> IO[str]:
+    try:
+        from compression import zstd  # Python 3.14+
+    except ImportError:
+        try:
+            import zstandard as zstd
+        except ImportError as exc:
+            raise ConfigError(
+                f"Reading or writing {path.name} requires the optional 'zstandard' "
+                "package: pip install 'esporifai[zstd]'"
+            ) from exc
+    return zstd.open(path, mode + "t", encoding="utf-8")
+
+
+def open_text(path: Path, mode: str = "r") -> IO[str]:
+    """Open ``path`` as UTF-8 text, compressing or decompressing by suffix.
+
+    ``.gz`` uses gzip and ``.zst`` uses Zstandard; anything else is plain text.
+    """
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    if path.suffix == ".zst":
+        return _zstd_open(path, mode)
+    return open(path, mode, encoding="utf-8", buffering=1 << 20)
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from functools import lru_cache
 from hashlib import blake2b
 from urllib.parse import unquote, urlparse
@@ -62,6 +62,8 @@ class Settings:
     login_timeout_ms: int = 30_000
     consent_timeout_ms: int = 5_000
     redirect_timeout_ms: int = 90_000
+    token_refresh_margin_seconds: float = 300.0
+    browser_session: bool = False
 
     @property
     def user_id(self) -> str:
@@ -76,7 +78,7 @@ class Settings:
         ).hexdigest()
 
     @classmethod
-    def from_env(cls) -> "Settings":
+    def from_env(cls) -> Settings:
         config = _load_environment()
         username = config.get("USERNAME") or config.get("SPOTIFY_USERNAME")
         password = config.get("PASSWORD") or config.get("SPOTIFY_PASSWORD")
@@ -99,15 +101,88 @@ class Settings:
             ),
             browser_slow_mo_ms=int(config.get("ESPORIFAI_BROWSER_SLOW_MO_MS", "300")),
             login_timeout_ms=int(config.get("ESPORIFAI_LOGIN_TIMEOUT_MS", "30000")),
-            consent_timeout_ms=int(
-                config.get("ESPORIFAI_CONSENT_TIMEOUT_MS", "5000")
-            ),
+            consent_timeout_ms=int(config.get("ESPORIFAI_CONSENT_TIMEOUT_MS", "5000")),
             redirect_timeout_ms=int(
                 config.get("ESPORIFAI_REDIRECT_TIMEOUT_MS", "90000")
             ),
+            token_refresh_margin_seconds=float(
+                config.get("ESPORIFAI_TOKEN_REFRESH_MARGIN_SECONDS", "300")
+            ),
+            browser_session=_flag(config.get("ESPORIFAI_BROWSER_SESSION")),
         )
 
 
 @lru_cache(maxsize=1)
 def get_settings() -> Settings:
     return Settings.from_env()
+
+
+def _flag(value: str | None) -> bool:
+    return (value or "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _parse_ttls(value: str) -> dict[str, float]:
+    """Parse ``endpoint=seconds`` pairs such as ``"tracks=86400,artists=3600"``."""
+    ttls = {}
+    for pair in value.split(","):
+        if not pair.strip():
+            continue
+        endpoint, _, seconds = pair.partition("=")
+        try:
+            ttls[endpoint.strip()] = float(seconds)
+        except ValueError as exc:
+            raise ConfigError(f"Invalid ESPORIFAI_CACHE_TTLS entry: {pair!r}") from exc
+    return ttls
+
+
+@dataclass(frozen=True)
+class ClientSettings:
+    request_timeout_seconds: float = 30.0
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry_seconds: float = 30.0
+    http2: bool = False
+    concurrency: int = 8
+    rate_limit_per_second: float = 10.0
+    rate_limit_burst: float = 20.0
+    max_retries: int = 5
+    max_retry_wait_seconds: float = 120.0
+    shared_rate_limit: bool = False
+    cache_enabled: bool = True
+    cache_max_bytes: int = 512 * 1024 * 1024
+    cache_ttls: dict[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def from_env(cls) -> ClientSettings:
+        config = _load_environment()
+        return cls(
+            request_timeout_seconds=float(
+                config.get("ESPORIFAI_REQUEST_TIMEOUT_SECONDS", "30.0")
+            ),
+            max_connections=int(config.get("ESPORIFAI_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(
+                config.get("ESPORIFAI_MAX_KEEPALIVE_CONNECTIONS", "10")
+            ),
+            keepalive_expiry_seconds=float(
+                config.get("ESPORIFAI_KEEPALIVE_EXPIRY_SECONDS", "30.0")
+            ),
+            http2=_flag(config.get("ESPORIFAI_HTTP2")),
+            concurrency=int(config.get("ESPORIFAI_CONCURRENCY", "8")),
+            rate_limit_per_second=float(config.get("ESPORIFAI_RATE_LIMIT", "10")),
+            rate_limit_burst=float(config.get("ESPORIFAI_RATE_LIMIT_BURST", "20")),
+            max_retries=int(config.get("ESPORIFAI_MAX_RETRIES", "5")),
+            max_retry_wait_seconds=float(
+                config.get("ESPORIFAI_MAX_RETRY_WAIT_SECONDS", "120")
+            ),
+            shared_rate_limit=_flag(config.get("ESPORIFAI_SHARED_RATE_LIMIT")),
+            cache_enabled=_flag(config.get("ESPORIFAI_CACHE", "1")),
+            cache_max_bytes=int(
+                float(config.get("ESPORIFAI_CACHE_MAX_MB", "512")) * 2**20
+            ),
+            cache_ttls=_parse_ttls(config.get("ESPORIFAI_CACHE_TTLS", "")),
+        )
+
+
+@lru_cache(maxsize=1)
+def get_client_settings() -> ClientSettings:
+    return ClientSettings.from_env()
@@ -18,6 +18,7 @@ APP_DIR: Path = Path(get_app_dir(__app_name__))
 
 AUTH_FILE = APP_DIR.joinpath("auth.json")
 TOKEN_FILE = APP_DIR.joinpath("token_info.json")
+BROWSER_STATE_DIR = APP_DIR.joinpath("browser")
 SCOPE = "user-read-recently-played user-top-read user-library-read playlist-read-collaborative playlist-read-private user-follow-read"
 SPOTIFY_AUTH_URL = "https://accounts.spotify.com/authorize"
 SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
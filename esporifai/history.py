@@ -1,13 +1,27 @@
 from __future__ import annotations
 
+import glob
+import heapq
 import json
+import sys
+import tempfile
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from enum import Enum
 from pathlib import Path
-from typing import Any
+from typing import IO, Any
+
+from .compact import CompactEvents
+from .compression import data_suffix, open_text
+from .serialization import dumps, dumps_line, loads
 
 Json = dict[str, Any]
 
+# Records sorted in memory before the JSONL writer spills sorted runs to disk.
+DEFAULT_SORT_BUFFER = 1_000_000
+
 
 class HistoryInputKind(str, Enum):
     recently_played = "recently-played"
@@ -25,45 +39,289 @@ class NormalizedHistory:
     artists: dict[str, Json] = field(default_factory=dict)
     skipped_rows: int = 0
 
+    @classmethod
+    def compact(cls) -> NormalizedHistory:
+        """A history whose events are stored column-wise in ``CompactEvents``."""
+        return cls(events=CompactEvents())
+
     def add_event(self, played_at: str, track_id: str, source: str) -> None:
-        event = self.events.setdefault(
-            (played_at, track_id),
-            {
+        if isinstance(self.events, CompactEvents):
+            self.events.add(played_at, track_id, source)
+            return
+        event = self.events.get((played_at, track_id))
+        if event is None:
+            self.events[(played_at, track_id)] = {
                 "played_at": played_at,
                 "track_id": track_id,
-                "sources": [],
-            },
-        )
-        event["sources"] = sorted(set(event["sources"]) | {source})
+                "sources": {source},
+            }
+        else:
+            add_sources(event, (source,))
+
+    def finalize(self) -> None:
+        """Sort the source sets gathered during ingestion, once, for output."""
+        if not isinstance(self.events, CompactEvents):
+            for event in self.events.values():
+                finalize_record(event)
+        for records in (self.tracks, self.albums, self.artists):
+            for record in records.values():
+                finalize_record(record)
+
+    def merge(self, other: NormalizedHistory) -> None:
+        """Fold ``other`` into this history as if its rows had been read here."""
+        if isinstance(self.events, CompactEvents) and isinstance(
+            other.events, CompactEvents
+        ):
+            self.events.update(other.events)
+        else:
+            for key, event in other.events.items():
+                for source in event["sources"]:
+                    self.add_event(key[0], key[1], source)
+        for records, incoming in (
+            (self.tracks, other.tracks),
+            (self.albums, other.albums),
+            (self.artists, other.artists),
+        ):
+            for record in incoming.values():
+                merge_record(records, record)
+        self.skipped_rows += other.skipped_rows
 
     def event_records(self) -> list[Json]:
+        self.finalize()
+        if isinstance(self.events, CompactEvents):
+            return list(self.events.values())
         return [self.events[key] for key in sorted(self.events)]
 
     def track_records(self) -> list[Json]:
+        self.finalize()
         return [self.tracks[key] for key in sorted(self.tracks)]
 
     def album_records(self) -> list[Json]:
+        self.finalize()
         return [self.albums[key] for key in sorted(self.albums)]
 
     def artist_records(self) -> list[Json]:
+        self.finalize()
         return [self.artists[key] for key in sorted(self.artists)]
 
     def as_summary(self) -> Json:
-        event_records = self.event_records()
+        if isinstance(self.events, CompactEvents):
+            played_range = self.events.played_at_range()
+        elif self.events:
+            played_range = (min(self.events)[0], max(self.events)[0])
+        else:
+            played_range = None
+        earliest, latest = played_range or (None, None)
         return {
-            "events": len(event_records),
+            "events": len(self.events),
             "tracks": len(self.tracks),
             "albums": len(self.albums),
             "artists": len(self.artists),
             "skipped_rows": self.skipped_rows,
-            "earliest": event_records[0]["played_at"] if event_records else None,
-            "latest": event_records[-1]["played_at"] if event_records else None,
+            "earliest": earliest,
+            "latest": latest,
         }
 
 
 def load_json(path: Path) -> Any:
-    with open(path) as handle:
-        return json.load(handle)
+    return loads(path.read_bytes())
+
+
+class JsonItemStream:
+    """Incrementally decode the entries of a JSON array from a text handle.
+
+    Accepts a top-level array, or a top-level object whose ``items`` member is
+    the array (other members are decoded and discarded). Only the current
+    entry and one read buffer are held in memory.
+    """
+
+    def __init__(self, handle: IO[str], chunk_size: int = 1 << 16):
+        self.handle = handle
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def __iter__(self) -> Iterator[Any]:
+        first = self._peek()
+        if first == "[":
+            yield from self._array()
+        elif first == "{":
+            yield from self._object_items()
+        elif first:
+            raise ValueError(f"Expected a JSON array or object, found {first!r}")
+
+    def _fill(self, size: int | None = None) -> bool:
+        if self.eof:
+            return False
+        chunk = self.handle.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        if self.pos > self.chunk_size:
+            self.buffer = self.buffer[self.pos :]
+            self.pos = 0
+        self.buffer += chunk
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str) -> None:
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, found {found!r}")
+        self.pos += 1
+
+    def _value(self) -> Any:
+        self._peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill(size):
+                    raise
+                size *= 2
+                continue
+            # A number that ends the buffer may continue in the next chunk.
+            if end == len(self.buffer) and self._fill(size):
+                continue
+            self.pos = end
+            return value
+
+    def _array(self) -> Iterator[Any]:
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._peek() == ",":
+                self.pos += 1
+                continue
+            self._expect("]")
+            return
+
+    def _object_items(self) -> Iterator[Any]:
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key == "items" and self._peek() == "[":
+                yield from self._array()
+            else:
+                self._value()
+            if self._peek() == ",":
+                self.pos += 1
+                continue
+            self._expect("}")
+            return
+
+
+@contextmanager
+def open_history_input(path: Path) -> Iterator[IO[str]]:
+    """Open a history input for reading; ``-`` reads from stdin."""
+    if str(path) == "-":
+        yield sys.stdin
+        return
+    with open_text(path) as handle:
+        yield handle
+
+
+def iter_history_rows(path: Path) -> Iterator[Any]:
+    """Yield export rows or ``items`` entries from ``path`` one at a time.
+
+    ``.jsonl`` files are read line by line; everything else is parsed with
+    ``JsonItemStream``. ``.gz`` and ``.zst`` files are decompressed as they
+    are read.
+    """
+    with open_history_input(path) as handle:
+        if data_suffix(path) == ".jsonl":
+            for line in handle:
+                if line.strip():
+                    yield loads(line)
+        else:
+            yield from JsonItemStream(handle)
+
+
+def history_input_files(pattern: str) -> list[Path]:
+    """Expand ``--input`` into the files to read, in a stable order.
+
+    Accepts ``-`` for stdin, a single file, a directory (its ``.json`` and
+    ``.jsonl`` files, compressed or not) or a glob pattern.
+    """
+    if pattern == "-":
+        return [Path("-")]
+    path = Path(pattern)
+    if path.is_dir():
+        return sorted(
+            child
+            for child in path.iterdir()
+            if child.is_file() and data_suffix(child) in (".json", ".jsonl")
+        )
+    if glob.has_magic(pattern):
+        matches = sorted(Path(match) for match in glob.glob(pattern))
+        return [match for match in matches if match.is_file()]
+    return [path] if path.is_file() else []
+
+
+def event_key(event: Json) -> tuple[str, str]:
+    return event["played_at"], event["track_id"]
+
+
+class EventLogMerge:
+    """Stream the union of event logs already sorted by ``(played_at, track_id)``.
+
+    Inputs are merged k-way, one line from each file at a time, so memory does
+    not grow with their size. Events that share a key are combined into one
+    with the union of their ``sources``.
+    """
+
+    def __init__(self, paths: list[Path]):
+        self.paths = paths
+        self.events = 0
+        self.duplicates = 0
+
+    def _read(self, path: Path) -> Iterator[Json]:
+        previous = None
+        with open_text(path) as handle:
+            for number, line in enumerate(handle, start=1):
+                if not line.strip():
+                    continue
+                event = loads(line)
+                key = event_key(event)
+                if previous is not None and key < previous:
+                    raise ValueError(
+                        f"{path}:{number} is not sorted by (played_at, track_id)"
+                    )
+                previous = key
+                yield event
+
+    def __iter__(self) -> Iterator[Json]:
+        current = None
+        for event in heapq.merge(*map(self._read, self.paths), key=event_key):
+            if current is not None and event_key(event) == event_key(current):
+                add_sources(current, event.get("sources", ()))
+                self.duplicates += 1
+                continue
+            if current is not None:
+                self.events += 1
+                yield finalize_record(current)
+            current = {**event, "sources": set(event.get("sources", ()))}
+        if current is not None:
+            self.events += 1
+            yield finalize_record(current)
 
 
 def first_present(*values: Any) -> Any:
@@ -189,28 +447,51 @@ def normalize_export_track(row: Json, source: str, track_id: str) -> Json:
     return {key: value for key, value in record.items() if value not in (None, [], {})}
 
 
+STATUS_RANK = {"missing": 0, "partial": 1, "complete": 2}
+
+
+def add_sources(record: Json, sources: Iterable[str]) -> None:
+    """Add to a record's source set, turning a finalized list back into a set."""
+    current = record.get("sources")
+    if isinstance(current, set):
+        current.update(sources)
+    else:
+        record["sources"] = {*(current or ()), *sources}
+
+
+def finalize_record(record: Json) -> Json:
+    """Replace a record's source set with the sorted list written to output."""
+    sources = record.get("sources")
+    if isinstance(sources, set):
+        record["sources"] = sorted(sources)
+    return record
+
+
 def merge_record(records: dict[str, Json], record: Json | None) -> None:
+    """Merge ``record`` into ``records`` by ID.
+
+    Sources are gathered in a set until ``finalize_record`` sorts them, the
+    highest ``metadata_status`` wins and other fields keep their first
+    non-empty value.
+    """
     if not record:
         return
 
     existing = records.get(record["id"])
     if existing is None:
         clean = {
-            key: value
-            for key, value in record.items()
-            if value not in (None, [], {})
+            key: value for key, value in record.items() if value not in (None, [], {})
         }
-        clean["sources"] = sorted(set(record.get("sources", [])))
+        clean["sources"] = set(record.get("sources", ()))
         records[record["id"]] = clean
         return
 
-    status_rank = {"missing": 0, "partial": 1, "complete": 2}
     for key, value in record.items():
         if key == "sources":
-            existing["sources"] = sorted(set(existing.get("sources", [])) | set(value))
+            add_sources(existing, value)
         elif key == "metadata_status":
-            current = status_rank.get(existing.get("metadata_status"), -1)
-            incoming = status_rank.get(value, -1)
+            current = STATUS_RANK.get(existing.get("metadata_status"), -1)
+            incoming = STATUS_RANK.get(value, -1)
             if incoming > current:
                 existing[key] = value
         elif value not in (None, [], {}) and existing.get(key) in (None, [], {}, ""):
@@ -265,19 +546,33 @@ def normalize_export_row(row: Json, source: str, history: NormalizedHistory) ->
     merge_record(history.tracks, normalize_export_track(row, source, track_id))
 
 
-def normalize_history_payload(
-    payload: Any,
+def normalize_history_rows(
+    rows: Iterable[Any],
     kind: HistoryInputKind,
     source: str,
+    history: NormalizedHistory | None = None,
 ) -> NormalizedHistory:
-    history = NormalizedHistory()
+    """Normalize rows one at a time into ``history`` (a new one by default)."""
+    history = _normalize_rows(rows, kind, source, history)
+    history.finalize()
+    return history
+
+
+def _normalize_rows(
+    rows: Iterable[Any],
+    kind: HistoryInputKind,
+    source: str,
+    history: NormalizedHistory | None = None,
+) -> NormalizedHistory:
+    """``normalize_history_rows`` with sources left as sets for more merging."""
+    history = history if history is not None else NormalizedHistory()
     if kind == HistoryInputKind.recently_played:
-        for item in spotify_items(payload):
-            normalize_recently_played_item(item, source, history)
+        for item in rows:
+            if isinstance(item, dict):
+                normalize_recently_played_item(item, source, history)
         return history
 
     if kind == HistoryInputKind.export:
-        rows = payload if isinstance(payload, list) else []
         for row in rows:
             if isinstance(row, dict):
                 normalize_export_row(row, source, history)
@@ -288,14 +583,145 @@ def normalize_history_payload(
     raise ValueError(f"Unsupported history kind: {kind}")
 
 
+def normalize_history_file(
+    path: Path, kind: HistoryInputKind, source: str, compact: bool = False
+) -> NormalizedHistory:
+    history = _normalize_file(path, kind, source, compact)
+    history.finalize()
+    return history
+
+
+def _normalize_file(
+    path: Path, kind: HistoryInputKind, source: str, compact: bool
+) -> NormalizedHistory:
+    history = NormalizedHistory.compact() if compact else NormalizedHistory()
+    return _normalize_rows(iter_history_rows(path), kind, source, history)
+
+
+def normalize_history_files(
+    paths: list[Path],
+    kind: HistoryInputKind,
+    source: str,
+    workers: int | None = None,
+    compact: bool = False,
+) -> NormalizedHistory:
+    """Normalize several inputs, parsing files in parallel worker processes.
+
+    Each worker builds a partial history for one file; the partials are merged
+    in ``paths`` order, so the result matches reading the files one after
+    another in a single process. ``compact`` stores events in
+    ``CompactEvents``.
+    """
+    history = NormalizedHistory.compact() if compact else NormalizedHistory()
+    if len(paths) <= 1 or workers == 1 or Path("-") in paths:
+        for path in paths:
+            _normalize_rows(iter_history_rows(path), kind, source, history)
+        history.finalize()
+        return history
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        partials = executor.map(
+            _normalize_file,
+            paths,
+            [kind] * len(paths),
+            [source] * len(paths),
+            [compact] * len(paths),
+        )
+        for partial in partials:
+            history.merge(partial)
+    history.finalize()
+    return history
+
+
+def normalize_history_payload(
+    payload: Any,
+    kind: HistoryInputKind,
+    source: str,
+) -> NormalizedHistory:
+    if kind == HistoryInputKind.recently_played:
+        return normalize_history_rows(spotify_items(payload), kind, source)
+    if kind == HistoryInputKind.export:
+        rows = payload if isinstance(payload, list) else []
+        return normalize_history_rows(rows, kind, source)
+    raise ValueError(f"Unsupported history kind: {kind}")
+
+
+def jsonl_line(record: Json) -> str:
+    return dumps_line(record) + "\n"
+
+
 def sorted_jsonl(records: list[Json]) -> str:
-    lines = [
-        json.dumps(record, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
-        for record in records
-    ]
-    return "\n".join(lines) + ("\n" if lines else "")
+    return "".join(jsonl_line(record) for record in records)
+
+
+def _spill_run(directory: str, run: list[tuple[Any, str]]) -> str:
+    run.sort(key=lambda pair: pair[0])
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=directory, suffix=".run", delete=False
+    ) as handle:
+        for key, line in run:
+            # Keys are plain JSON, whose encoder escapes tabs, so the first tab
+            # always separates the key from the record line.
+            handle.write(dumps(key) + "\t" + line)
+    return handle.name
+
+
+def _read_run(path: str) -> Iterator[tuple[Any, str]]:
+    with open(path, encoding="utf-8") as handle:
+        for raw in handle:
+            key, line = raw.split("\t", 1)
+            yield loads(key), line
+
+
+def sorted_lines(
+    records: dict[Any, Json], buffer_size: int = DEFAULT_SORT_BUFFER
+) -> Iterator[str]:
+    """Yield ``records`` as JSONL lines ordered by their dict keys.
+
+    At most ``buffer_size`` serialized lines are held at once. Larger inputs
+    are written to disk as sorted runs and combined with a k-way merge.
+    """
+    if isinstance(records, CompactEvents):
+        # Already iterated in key order, without a per-event index to sort.
+        yield from map(jsonl_line, records.values())
+        return
+
+    buffer_size = max(buffer_size, 1)
+    with tempfile.TemporaryDirectory(prefix="esporifai-sort-") as directory:
+        run: list[tuple[Any, str]] = []
+        runs: list[str] = []
+        for key, record in records.items():
+            run.append((key, jsonl_line(record)))
+            if len(run) >= buffer_size:
+                runs.append(_spill_run(directory, run))
+                run = []
+
+        if not runs:
+            run.sort(key=lambda pair: pair[0])
+            for _, line in run:
+                yield line
+            return
+
+        if run:
+            runs.append(_spill_run(directory, run))
+        run = []
+        merged = heapq.merge(*map(_read_run, runs), key=lambda pair: pair[0])
+        for _, line in merged:
+            yield line
+
+
+def write_lines(output: Path, lines: Iterable[str]) -> None:
+    """Write JSONL lines to ``output`` through a buffered handle; ``-`` is stdout.
+
+    A ``.gz`` or ``.zst`` suffix compresses the output as it is written.
+    """
+    if str(output) == "-":
+        sys.stdout.writelines(lines)
+        return
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open_text(output, "w") as handle:
+        handle.writelines(lines)
 
 
-def write_jsonl(path: Path, records: list[Json]) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(sorted_jsonl(records))
+def write_jsonl(path: Path, records: Iterable[Json]) -> None:
+    write_lines(path, map(jsonl_line, records))
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+import httpx
+
+from .config import ClientSettings
+from .constants import APP_DIR
+from .locking import file_lock
+from .serialization import dumps, loads
+
+RATE_LIMIT_FILE = APP_DIR.joinpath("rate_limit.json")
+
+
+class TokenBucket:
+    """Token bucket that hands out request slots at ``rate`` per second.
+
+    ``reserve`` always takes a token and returns how long the caller must wait
+    before using it, so concurrent callers are spaced out instead of racing.
+    When ``state_file`` is set the bucket lives on disk under a lock file and
+    every process using that file draws from the same budget.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        state_file: Path | None = None,
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._state = {"tokens": capacity, "updated": time.time(), "blocked_until": 0.0}
+
+    def reserve(self) -> float:
+        with self._lock:
+            return self._update(self._take)
+
+    def pause(self, seconds: float) -> None:
+        """Block every caller sharing this bucket for ``seconds``."""
+
+        def block(state: dict, now: float) -> float:
+            state["blocked_until"] = max(state["blocked_until"], now + seconds)
+            return 0.0
+
+        with self._lock:
+            self._update(block)
+
+    def _take(self, state: dict, now: float) -> float:
+        elapsed = max(now - state["updated"], 0.0)
+        state["tokens"] = min(self.capacity, state["tokens"] + elapsed * self.rate)
+        state["updated"] = now
+        state["tokens"] -= 1
+        wait = -state["tokens"] / self.rate if state["tokens"] < 0 else 0.0
+        return max(wait, state["blocked_until"] - now)
+
+    def _update(self, apply) -> float:
+        if self.state_file is None:
+            return apply(self._state, time.time())
+
+        with file_lock(self.state_file.with_suffix(".lock")):
+            try:
+                state = {**self._state, **loads(self.state_file.read_bytes())}
+            except (FileNotFoundError, ValueError):
+                state = dict(self._state)
+            result = apply(state, time.time())
+            self.state_file.write_text(dumps(state))
+            return result
+
+
+class AdaptiveLimit:
+    """Additive-increase, multiplicative-decrease concurrency limit."""
+
+    def __init__(self, maximum: int, minimum: int = 1):
+        self.maximum = max(maximum, minimum)
+        self.minimum = minimum
+        self.value = float(self.maximum)
+        self.in_flight = 0
+
+    @property
+    def available(self) -> bool:
+        return self.in_flight < max(int(self.value), self.minimum)
+
+    def success(self) -> None:
+        self.value = min(self.maximum, self.value + 1 / self.value)
+
+    def throttled(self) -> None:
+        self.value = max(self.minimum, self.value / 2)
+
+
+class ThreadGate(AdaptiveLimit):
+    def __init__(self, maximum: int, minimum: int = 1):
+        super().__init__(maximum, minimum)
+        self._condition = threading.Condition()
+
+    def __enter__(self) -> ThreadGate:
+        with self._condition:
+            self._condition.wait_for(lambda: self.available)
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+
+class AsyncGate(AdaptiveLimit):
+    def __init__(self, maximum: int, minimum: int = 1):
+        super().__init__(maximum, minimum)
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self) -> AsyncGate:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.available)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+
+def retry_after_seconds(response: httpx.Response) -> float | None:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    """Paces requests and decides when a throttled request should be retried.
+
+    Clients call ``reserve`` before each request and ``retry_delay`` after it.
+    A 429 pauses the shared bucket for the ``Retry-After`` period, so every
+    caller backs off together rather than each rediscovering the limit.
+    """
+
+    def __init__(
+        self,
+        rate: float | None = None,
+        burst: float | None = None,
+        max_retries: int = 5,
+        max_retry_wait: float = 120.0,
+        state_file: Path | None = None,
+    ):
+        self.bucket = (
+            TokenBucket(rate, burst or max(rate, 1.0), state_file) if rate else None
+        )
+        self.max_retries = max_retries
+        self.max_retry_wait = max_retry_wait
+
+    @classmethod
+    def from_settings(cls, settings: ClientSettings) -> RequestScheduler:
+        return cls(
+            rate=settings.rate_limit_per_second,
+            burst=settings.rate_limit_burst,
+            max_retries=settings.max_retries,
+            max_retry_wait=settings.max_retry_wait_seconds,
+            state_file=RATE_LIMIT_FILE if settings.shared_rate_limit else None,
+        )
+
+    def reserve(self) -> float:
+        return self.bucket.reserve() if self.bucket else 0.0
+
+    def retry_delay(self, response: httpx.Response, attempt: int) -> float | None:
+        """Return how long to wait before retrying, or ``None`` to give up."""
+        if response.status_code != 429 or attempt >= self.max_retries:
+            return None
+
+        delay = retry_after_seconds(response)
+        if delay is None:
+            delay = min(2.0**attempt, self.max_retry_wait)
+        if delay > self.max_retry_wait:
+            return None
+
+        if self.bucket:
+            self.bucket.pause(delay)
+        return delay
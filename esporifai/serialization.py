@@ -0,0 +1,137 @@
+"""JSON encoding and decoding through the fastest installed backend.
+
+orjson is preferred, then msgspec, then the standard library ``json`` module.
+Every backend decodes to the same Python objects and encodes to the same
+bytes: ``dumps`` and ``dumps_line`` write compact separators with non-ASCII
+left as is, ``dumps_pretty`` writes the standard library's ``indent=2``
+output. Fast backends spell some floats differently ("0.00001" for 1e-05,
+"1e16" for 1e+16), so their output is re-encoded with the standard library
+whenever it might hold such a float, as it is for pretty output with
+non-ASCII text. Anything a fast backend cannot handle, such as integers
+beyond 64 bits or non-string keys, falls back to the standard library, and
+so do msgspec encodes that need ``default``.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Callable
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - optional dependency
+    msgspec = None
+
+if orjson is not None:
+    BACKEND = "orjson"
+    # Hand datetimes, dataclasses and subclasses to ``default`` like json does.
+    _PASSTHROUGH = (
+        orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+        | orjson.OPT_PASSTHROUGH_SUBCLASS
+    )
+elif msgspec is not None:
+    BACKEND = "msgspec"
+    _decoder = msgspec.json.Decoder()
+    _encoder = msgspec.json.Encoder()
+    _sorted_encoder = msgspec.json.Encoder(order="sorted")
+else:
+    BACKEND = "json"
+
+# Matches every float a fast backend spells differently from ``json``: an
+# exponent, or a small number written out in full. Strings that happen to
+# match only cost a re-encode.
+_FLOAT_SPELLING = re.compile(rb"\de|0\.0000")
+
+
+def _portable(encoded: bytes) -> bool:
+    return _FLOAT_SPELLING.search(encoded) is None
+
+
+def loads(data: str | bytes) -> Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    elif msgspec is not None:
+        try:
+            return _decoder.decode(data)
+        except (msgspec.DecodeError, TypeError):
+            pass
+    # Also raises the standard json.JSONDecodeError for invalid input.
+    return json.loads(data)
+
+
+def dumps(
+    obj: Any,
+    *,
+    sort_keys: bool = False,
+    default: Callable[[Any], Any] | None = None,
+) -> str:
+    """Encode ``obj`` compactly on one line."""
+    if orjson is not None:
+        option = orjson.OPT_SORT_KEYS if sort_keys else 0
+        if default is not None:
+            option |= _PASSTHROUGH
+        try:
+            encoded = orjson.dumps(obj, default=default, option=option)
+            if _portable(encoded):
+                return encoded.decode()
+        except TypeError:
+            pass
+    elif msgspec is not None and default is None:
+        try:
+            encoder = _sorted_encoder if sort_keys else _encoder
+            encoded = encoder.encode(obj)
+            if _portable(encoded):
+                return encoded.decode()
+        except (msgspec.EncodeError, TypeError, OverflowError):
+            pass
+    return json.dumps(
+        obj,
+        ensure_ascii=False,
+        sort_keys=sort_keys,
+        separators=(",", ":"),
+        default=default,
+    )
+
+
+def dumps_line(obj: Any) -> str:
+    """Encode ``obj`` in the canonical JSONL form, without the newline."""
+    if orjson is not None:
+        try:
+            encoded = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+            if _portable(encoded):
+                return encoded.decode()
+        except TypeError:
+            pass
+    elif msgspec is not None:
+        try:
+            encoded = _sorted_encoder.encode(obj)
+            if _portable(encoded):
+                return encoded.decode()
+        except (msgspec.EncodeError, TypeError, OverflowError):
+            pass
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def dumps_pretty(obj: Any) -> str:
+    """Encode ``obj`` with two-space indentation, stringifying unknown types."""
+    if orjson is not None:
+        try:
+            encoded = orjson.dumps(
+                obj, default=str, option=orjson.OPT_INDENT_2 | _PASSTHROUGH
+            )
+            # The standard library escapes non-ASCII text in this form.
+            if encoded.isascii() and _portable(encoded):
+                return encoded.decode()
+        except TypeError:
+            pass
+    return json.dumps(obj, indent=2, default=str)
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Hashable
+from concurrent.futures import Future
+from typing import Any, Callable
+
+
+class _RecentResults:
+    """Bounded, time-limited memo of completed calls.
+
+    ``max_bytes`` caps the summed ``size`` of the kept results; the least
+    recently used are dropped first and a result larger than the cap is not
+    kept at all.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int,
+        max_bytes: int | None = None,
+        size: Callable[[Any], int] = lambda result: 0,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = size
+        self.total_bytes = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, result, _ = entry
+        if time.monotonic() >= expires_at:
+            self._discard(key)
+            return False, None
+        self._entries.move_to_end(key)
+        return True, result
+
+    def put(self, key: Hashable, result: Any) -> None:
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        nbytes = self.size(result)
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            return
+        self._discard(key)
+        self._entries[key] = (time.monotonic() + self.ttl, result, nbytes)
+        self.total_bytes += nbytes
+        while len(self._entries) > self.max_entries or (
+            self.max_bytes is not None and self.total_bytes > self.max_bytes
+        ):
+            self._discard(next(iter(self._entries)))
+
+    def _discard(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[2]
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one execution.
+
+    Threads asking for a key that is already in flight wait for the leader's
+    result. Results accepted by ``remember`` are also kept for ``ttl`` seconds,
+    up to ``max_entries`` of them and ``max_bytes`` of their ``size`` in total,
+    so repeats shortly afterwards are answered from memory.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300.0,
+        max_entries: int = 4096,
+        remember: Callable[[Any], bool] = lambda result: True,
+        max_bytes: int | None = None,
+        size: Callable[[Any], int] = lambda result: 0,
+    ):
+        self.remember = remember
+        self._recent = _RecentResults(ttl, max_entries, max_bytes, size)
+        self._calls: dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            found, result = self._recent.get(key)
+            if found:
+                return result
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as exc:
+            with self._lock:
+                del self._calls[key]
+            future.set_exception(exc)
+            raise
+
+        with self._lock:
+            del self._calls[key]
+            if self.remember(result):
+                self._recent.put(key, result)
+        future.set_result(result)
+        return result
+
+
+class AsyncSingleFlight:
+    """Asyncio counterpart of ``SingleFlight`` for use inside one event loop."""
+
+    def __init__(
+        self,
+        ttl: float = 300.0,
+        max_entries: int = 4096,
+        remember: Callable[[Any], bool] = lambda result: True,
+        max_bytes: int | None = None,
+        size: Callable[[Any], int] = lambda result: 0,
+    ):
+        self.remember = remember
+        self._recent = _RecentResults(ttl, max_entries, max_bytes, size)
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        found, result = self._recent.get(key)
+        if found:
+            return result
+        if key in self._calls:
+            return await asyncio.shield(self._calls[key])
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Followers re-raise the exception; mark it retrieved for the leader.
+            future.exception()
+            raise
+        else:
+            if self.remember(result):
+                self._recent.put(key, result)
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import sqlite3
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from .constants import APP_DIR
+from .history import Json, NormalizedHistory, finalize_record, merge_record
+from .serialization import dumps_line, loads
+
+STORE_FILE = APP_DIR.joinpath("history.sqlite3")
+
+# The events primary key leads with played_at, so it doubles as its index.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    played_at TEXT NOT NULL,
+    track_id TEXT NOT NULL,
+    sources TEXT NOT NULL,
+    PRIMARY KEY (played_at, track_id)
+);
+CREATE INDEX IF NOT EXISTS events_track_id ON events (track_id);
+CREATE TABLE IF NOT EXISTS tracks (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    album_id TEXT,
+    metadata_status TEXT,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS albums (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS artists (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS track_artists (
+    track_id TEXT NOT NULL,
+    artist_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (track_id, artist_id)
+);
+CREATE INDEX IF NOT EXISTS track_artists_artist_id ON track_artists (artist_id);
+"""
+
+# Sources are stored as sorted JSON arrays; conflicting events get the union.
+UPSERT_EVENT = """
+INSERT INTO events (played_at, track_id, sources) VALUES (?, ?, ?)
+ON CONFLICT (played_at, track_id) DO UPDATE SET sources = (
+    SELECT json_group_array(value) FROM (
+        SELECT value FROM json_each(events.sources)
+        UNION SELECT value FROM json_each(excluded.sources)
+        ORDER BY value
+    )
+)
+WHERE EXISTS (
+    SELECT 1 FROM json_each(excluded.sources)
+    WHERE value NOT IN (SELECT value FROM json_each(events.sources))
+)
+"""
+
+CATALOG_COLUMNS = {
+    "tracks": ("name", "album_id", "metadata_status"),
+    "albums": ("name",),
+    "artists": ("name",),
+}
+
+
+def _chunks(items: list, size: int) -> Iterable[list]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+@dataclass
+class IngestSummary:
+    events: int = 0
+    tracks: int = 0
+    albums: int = 0
+    artists: int = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "events": self.events,
+            "tracks": self.tracks,
+            "albums": self.albums,
+            "artists": self.artists,
+        }
+
+
+class HistoryStore:
+    """SQLite copy of normalized history for indexed queries.
+
+    Ingesting applies the same precedence as ``merge_record``, so loading the
+    same data twice, or loading overlapping deltas, converges on the same rows
+    as normalizing all inputs in one run.
+    """
+
+    def __init__(self, path: Path = STORE_FILE, *, batch_size: int = 500):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self._db = sqlite3.connect(path, timeout=30.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> HistoryStore:
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def ingest(self, history: NormalizedHistory) -> IngestSummary:
+        """Upsert ``history`` in one transaction and count rows added or changed."""
+        summary = IngestSummary()
+        history.finalize()
+        with self._db:
+            summary.events = self._upsert_events(history.events.values())
+            summary.tracks = self._upsert_catalog("tracks", history.tracks)
+            summary.albums = self._upsert_catalog("albums", history.albums)
+            summary.artists = self._upsert_catalog("artists", history.artists)
+        return summary
+
+    def _upsert_events(self, events: Iterable[Json]) -> int:
+        before = self._db.total_changes
+        self._db.executemany(
+            UPSERT_EVENT,
+            (
+                (
+                    event["played_at"],
+                    event["track_id"],
+                    dumps_line(event["sources"]),
+                )
+                for event in events
+            ),
+        )
+        return self._db.total_changes - before
+
+    def _upsert_catalog(self, table: str, records: dict[str, Json]) -> int:
+        columns = CATALOG_COLUMNS[table]
+        updates = ", ".join(
+            f"{column} = excluded.{column}" for column in (*columns, "record")
+        )
+        upsert = (
+            f"INSERT INTO {table} (id, {', '.join(columns)}, record) "
+            f"VALUES ({', '.join('?' * (len(columns) + 2))}) "
+            f"ON CONFLICT (id) DO UPDATE SET {updates}"
+        )
+        changed = 0
+        for chunk in _chunks(list(records), self.batch_size):
+            stored = dict(
+                self._db.execute(
+                    f"SELECT id, record FROM {table} "
+                    f"WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+            )
+            rows: list[tuple[Any, ...]] = []
+            merged_records = []
+            for record_id in chunk:
+                merged: dict[str, Json] = {}
+                if record_id in stored:
+                    merged[record_id] = loads(stored[record_id])
+                merge_record(merged, records[record_id])
+                record = finalize_record(merged[record_id])
+                body = dumps_line(record)
+                if body == stored.get(record_id):
+                    continue
+                rows.append(
+                    (record_id, *(record.get(column) for column in columns), body)
+                )
+                merged_records.append(record)
+
+            self._db.executemany(upsert, rows)
+            if table == "tracks":
+                self._replace_track_artists(merged_records)
+            changed += len(rows)
+        return changed
+
+    def _replace_track_artists(self, tracks: list[Json]) -> None:
+        self._db.executemany(
+            "DELETE FROM track_artists WHERE track_id = ?",
+            [(track["id"],) for track in tracks],
+        )
+        self._db.executemany(
+            "INSERT OR IGNORE INTO track_artists (track_id, artist_id, position) "
+            "VALUES (?, ?, ?)",
+            [
+                (track["id"], artist_id, position)
+                for track in tracks
+                for position, artist_id in enumerate(track.get("artist_ids", []))
+            ],
+        )
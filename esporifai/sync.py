@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import os
+from datetime import datetime as dt
+from pathlib import Path
+
+from .api import AccessToken, iter_user_recently_played
+from .constants import APP_DIR
+from .history import sorted_jsonl
+from .locking import file_lock
+from .serialization import loads
+from .utils import load_json, write_json
+
+SYNC_STATE_FILE = APP_DIR.joinpath("sync_state.json")
+
+
+def played_at_ms(played_at: str) -> int:
+    """Convert a Spotify ``played_at`` timestamp to Unix milliseconds."""
+    parsed = dt.fromisoformat(played_at.replace("Z", "+00:00"))
+    return int(parsed.timestamp() * 1_000)
+
+
+def play_key(item: dict) -> tuple[str, str]:
+    return item.get("played_at") or "", (item.get("track") or {}).get("id") or ""
+
+
+def user_lock_file(state_file: Path, user_id: str) -> Path:
+    return state_file.with_name(f"{state_file.stem}.{user_id}.lock")
+
+
+def save_user_state(state_file: Path, user_id: str, user_state: dict) -> None:
+    """Replace ``user_id``'s entry in the shared state file atomically."""
+    with file_lock(state_file.with_suffix(".lock")):
+        state = load_json(state_file)
+        state[user_id] = user_state
+        temporary = state_file.with_name(f".{state_file.name}.{os.getpid()}.tmp")
+        write_json(temporary, state)
+        os.replace(temporary, state_file)
+
+
+def recover_pending_plays(output: Path, pending: dict | None) -> list[dict]:
+    """Read plays a crashed run appended after recording ``pending``.
+
+    A torn last line is cut off so the next append starts on a fresh line.
+    """
+    if not pending or pending.get("output") != str(output) or not output.exists():
+        return []
+    size = int(pending["size"])
+    with open(output, "rb+") as handle:
+        handle.seek(size)
+        tail = handle.read()
+        complete = tail[: tail.rfind(b"\n") + 1]
+        if len(complete) < len(tail):
+            handle.truncate(size + len(complete))
+    return [loads(line) for line in complete.splitlines() if line.strip()]
+
+
+def sync_recently_played(
+    access_token: AccessToken,
+    user_id: str,
+    output: Path,
+    state_file: Path = SYNC_STATE_FILE,
+) -> dict:
+    """Append plays newer than the stored cursor for ``user_id`` to ``output``.
+
+    The cursor is the latest ``played_at`` already written, so each run asks
+    Spotify only for ``after=<cursor>``. Plays are deduplicated on
+    ``(played_at, track_id)`` and appended oldest first. Before appending,
+    the output size is saved as ``pending``; a run that finds it left over
+    from a crash reads the plays written after it instead of appending them
+    twice. Each user syncs under its own lock.
+    """
+    with file_lock(user_lock_file(state_file, user_id)):
+        user_state = load_json(state_file).get(user_id, {})
+        cursor = int(user_state.get("after", 0))
+        seen = {tuple(key) for key in user_state.get("keys", [])}
+        written = recover_pending_plays(output, user_state.get("pending"))
+        seen.update(play_key(item) for item in written)
+
+        new_items = []
+        for item in iter_user_recently_played(
+            access_token, cursor, direction="after", limit=50
+        ):
+            key = play_key(item)
+            if not all(key) or key in seen:
+                continue
+            seen.add(key)
+            new_items.append(item)
+
+        new_items.sort(key=play_key)
+        if new_items:
+            output.parent.mkdir(parents=True, exist_ok=True)
+            size = output.stat().st_size if output.exists() else 0
+            pending = {"output": str(output), "size": size}
+            save_user_state(state_file, user_id, {**user_state, "pending": pending})
+            with open(output, "a", encoding="utf-8") as handle:
+                handle.write(sorted_jsonl(new_items))
+            written.extend(new_items)
+
+        if written or "pending" in user_state:
+            if written:
+                latest = max(item["played_at"] for item in written)
+                cursor = max(cursor, played_at_ms(latest))
+                keys = sorted(key for key in seen if key[0] == latest)
+            else:
+                keys = user_state.get("keys", [])
+            save_user_state(state_file, user_id, {"after": cursor, "keys": keys})
+
+    return {"new": len(new_items), "after": cursor, "output": str(output)}
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime as dt
+from typing import Callable
+
+from .config import Settings, get_settings
+from .utils import handle_authorization
+
+# Seconds to wait before retrying a failed background refresh.
+REFRESH_RETRY_SECONDS = 30.0
+
+
+def token_expiry(token_info: dict) -> dt:
+    """Return ``expires_at`` as a datetime, whether fresh or loaded from JSON."""
+    expires_at = token_info["expires_at"]
+    return expires_at if isinstance(expires_at, dt) else dt.fromisoformat(expires_at)
+
+
+class TokenManager:
+    """Keeps the parsed token in memory and refreshes it before it expires.
+
+    Once the token is within ``refresh_margin`` seconds of ``expires_at``, the
+    next caller starts a refresh on a background thread and every caller keeps
+    getting the still-valid token meanwhile. Callers wait only when the token
+    has actually expired, for example after a failed background refresh.
+    """
+
+    def __init__(
+        self,
+        settings: Settings | None = None,
+        *,
+        refresh_margin: float | None = None,
+        save_files: bool = True,
+        authorize: Callable[..., dict] = handle_authorization,
+    ):
+        self.settings = settings or get_settings()
+        self.refresh_margin = (
+            self.settings.token_refresh_margin_seconds
+            if refresh_margin is None
+            else refresh_margin
+        )
+        self.save_files = save_files
+        self.authorize = authorize
+        self.error: Exception | None = None
+        self._info: dict | None = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing: threading.Thread | None = None
+        self._retry_at = 0.0
+
+    def token_info(self, force: bool = False) -> dict:
+        with self._lock:
+            info = self._info
+        if info is None or force:
+            # A freshly loaded token may already be inside the margin.
+            info = self._refresh_now(info, force=force)
+
+        remaining = (token_expiry(info) - dt.now()).total_seconds()
+        if remaining <= 0:
+            return self._refresh_now(info)
+        if remaining <= self.refresh_margin:
+            self._refresh_in_background(info)
+        return info
+
+    def access_token(self) -> str:
+        """Current access token; pass the bound method to clients as a callable."""
+        return self.token_info()["access_token"]
+
+    def set(self, token_info: dict) -> None:
+        with self._lock:
+            self._info = token_info
+
+    def _load(self, force: bool, stale: dict | None) -> dict:
+        return self.authorize(
+            save_files=self.save_files,
+            force=force,
+            settings=self.settings,
+            stale_token=stale["access_token"] if stale else None,
+            refresh_margin=self.refresh_margin,
+        )
+
+    def _refresh_now(self, stale: dict | None, force: bool = False) -> dict:
+        with self._refresh_lock:
+            with self._lock:
+                current = self._info
+            # Another caller may have refreshed while we waited for the lock.
+            if current is not None and current is not stale:
+                return current
+            # The first load reads the token file and only refreshes if needed.
+            info = self._load(force=force or stale is not None, stale=stale)
+            self.set(info)
+            self.error = None
+            return info
+
+    def _refresh_in_background(self, stale: dict) -> None:
+        with self._lock:
+            if self._refreshing is not None and self._refreshing.is_alive():
+                return
+            if time.monotonic() < self._retry_at:
+                return
+            self._refreshing = threading.Thread(
+                target=self._background_refresh,
+                args=(stale,),
+                name="esporifai-token-refresh",
+                daemon=True,
+            )
+            self._refreshing.start()
+
+    def _background_refresh(self, stale: dict) -> None:
+        try:
+            self._refresh_now(stale)
+        except Exception as exc:  # Keep serving the still-valid token.
+            self.error = exc
+            self._retry_at = time.monotonic() + REFRESH_RETRY_SECONDS
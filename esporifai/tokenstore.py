@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import os
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+from .constants import TOKEN_FILE
+from .locking import file_lock
+from .serialization import dumps_pretty, loads
+
+SHARD_SUFFIX = ".d"
+
+
+class TokenStore:
+    """Token info keyed by ``Settings.user_id``, one small file per user.
+
+    ``token_info.json`` gets a ``token_info.d`` directory next to it holding
+    ``<user_id>.json``, so loading one account parses one token however many
+    accounts share the host. Writes take that user's lock and rename a
+    temporary file into place: readers never see a partial file and writers
+    for other users are never blocked or overwritten. Tokens saved by older
+    versions in the single ``token_info.json`` mapping are still read until
+    the user's token is next written.
+    """
+
+    def __init__(self, path: Path = TOKEN_FILE):
+        self.path = path
+        self.directory = path.with_name(path.stem + SHARD_SUFFIX)
+
+    def shard_path(self, user_id: str) -> Path:
+        return self.directory / f"{user_id}.json"
+
+    def lock_path(self, user_id: str) -> Path:
+        return self.directory / f".{user_id}.lock"
+
+    @contextmanager
+    def lock(self, user_id: str) -> Iterator[None]:
+        """Hold the cross-process lock guarding ``user_id``'s token."""
+        with file_lock(self.lock_path(user_id)):
+            yield
+
+    def get(self, user_id: str) -> dict | None:
+        try:
+            return loads(self.shard_path(user_id).read_bytes())
+        except FileNotFoundError:
+            return self._legacy().get(user_id)
+
+    def put(self, user_id: str, token_info: dict) -> None:
+        with self.lock(user_id):
+            self.write(user_id, token_info)
+
+    def write(self, user_id: str, token_info: dict) -> None:
+        """Replace ``user_id``'s token; the caller must hold ``lock(user_id)``."""
+        shard = self.shard_path(user_id)
+        shard.parent.mkdir(parents=True, exist_ok=True)
+        temporary = shard.with_name(f".{shard.name}.{os.getpid()}.tmp")
+        temporary.write_text(dumps_pretty(token_info), encoding="utf-8")
+        os.replace(temporary, shard)
+
+    def has_tokens(self) -> bool:
+        if self.directory.is_dir() and any(self.directory.glob("*.json")):
+            return True
+        return bool(self._legacy())
+
+    def _legacy(self) -> dict:
+        try:
+            return loads(self.path.read_bytes())
+        except FileNotFoundError:
+            return {}
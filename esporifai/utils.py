@@ -1,40 +1,62 @@
 from __future__ import annotations
 
 import re
-import json
-from time import monotonic
+import sys
+import webbrowser
+from collections.abc import Iterable
 from datetime import datetime as dt
 from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from pathlib import Path
+from time import monotonic
 from urllib.parse import parse_qs, urlencode, urlparse
 
 import httpx
 from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
-from playwright.sync_api import sync_playwright
+from playwright.sync_api import expect, sync_playwright
 from typer import Exit
 
 from .config import ConfigError, Settings, get_settings
 from .constants import (
     AUTH_FILE,
+    BROWSER_STATE_DIR,
     SCOPE,
     SPOTIFY_AUTH_URL,
     SPOTIFY_TOKEN_URL,
     TOKEN_FILE,
 )
+from .serialization import dumps, dumps_pretty, loads
+from .tokenstore import TokenStore
+
+USERNAME_SELECTOR = "#username, [data-testid='login-username']"
+PASSWORD_SELECTOR = (
+    "#password, [data-testid='login-password'], "
+    "input[type='password'], input[autocomplete='current-password']"
+)
+LOGIN_BUTTON_SELECTOR = "[data-testid='login-button']"
+CONSENT_SELECTOR = "[data-testid='auth-accept']"
+CONSENT_BUTTON_NAME = re.compile(r"^(agree|accept|authorize|allow|continue)$", re.I)
+PASSWORD_LOGIN_NAME = re.compile(
+    r"(log ?in|login).*(with|using).*(password)|password instead", re.I
+)
+# Resource types the login pages render fine without.
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "font", "media"})
 
 
 def load_json(path: Path):
     if not path.exists():
         return {}
 
-    with open(path, "r") as handle:
-        return json.load(handle)
+    return loads(path.read_bytes())
 
 
 def write_json(path: Path, payload: dict):
     path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w") as handle:
-        json.dump(payload, handle, indent=2, default=str)
+    path.write_text(dumps_pretty(payload), encoding="utf-8")
+
+
+def token_store() -> TokenStore:
+    return TokenStore(TOKEN_FILE)
 
 
 def build_auth_payload(code: str, settings: Settings | None = None) -> dict:
@@ -62,41 +84,38 @@ def build_auth_code_url(
             "build_auth_code_url requires either settings or client_id and redirect_uri"
         )
 
-    return (
-        f"{SPOTIFY_AUTH_URL}?"
-        + urlencode(
-            {
-                "client_id": client_id,
-                "redirect_uri": redirect_uri,
-                "scope": SCOPE,
-                "response_type": "code",
-            }
-        )
+    return f"{SPOTIFY_AUTH_URL}?" + urlencode(
+        {
+            "client_id": client_id,
+            "redirect_uri": redirect_uri,
+            "scope": SCOPE,
+            "response_type": "code",
+        }
     )
 
 
 def auth_check(user_id: str | None = None):
     auth_file = load_json(AUTH_FILE)
-    token_file = load_json(TOKEN_FILE)
+    store = token_store()
 
     if user_id is None:
         try:
             user_id = get_settings().user_id
         except ConfigError:
-            return bool(auth_file or token_file)
+            return bool(auth_file) or store.has_tokens()
 
-    return bool(auth_file.get(user_id) or token_file.get(user_id))
+    return bool(auth_file.get(user_id) or store.get(user_id))
 
 
 def get_auth_status(settings: Settings | None = None) -> dict:
     settings = settings or get_settings()
     auth_file = load_json(AUTH_FILE)
-    token_file = load_json(TOKEN_FILE)
-    token_info = token_file.get(settings.user_id)
+    store = token_store()
+    token_info = store.get(settings.user_id)
     return {
         "app_dir": str(AUTH_FILE.parent),
         "auth_file": str(AUTH_FILE),
-        "token_file": str(TOKEN_FILE),
+        "token_file": str(store.shard_path(settings.user_id)),
         "has_auth_artifact": bool(auth_file.get(settings.user_id)),
         "has_token_artifact": bool(token_info),
         "has_refresh_token_env": bool(settings.spotify_refresh_token),
@@ -110,13 +129,14 @@ def is_expired(expires_at):
     return now > dt.fromisoformat(expires_at)
 
 
+def expires_within(expires_at, seconds: float) -> bool:
+    return dt.fromisoformat(expires_at) - dt.now() <= timedelta(seconds=seconds)
+
+
 def maybe_click_consent(page) -> bool:
     candidates = [
-        page.locator("[data-testid='auth-accept']").first,
-        page.get_by_role(
-            "button",
-            name=re.compile(r"^(agree|accept|authorize|allow|continue)$", re.I),
-        ).first,
+        page.locator(CONSENT_SELECTOR).first,
+        page.get_by_role("button", name=CONSENT_BUTTON_NAME).first,
     ]
 
     for candidate in candidates:
@@ -133,20 +153,8 @@ def maybe_click_consent(page) -> bool:
 
 def maybe_switch_to_password_login(page) -> bool:
     candidates = [
-        page.get_by_role(
-            "link",
-            name=re.compile(
-                r"(log ?in|login).*(with|using).*(password)|password instead",
-                re.I,
-            ),
-        ).first,
-        page.get_by_role(
-            "button",
-            name=re.compile(
-                r"(log ?in|login).*(with|using).*(password)|password instead",
-                re.I,
-            ),
-        ).first,
+        page.get_by_role("link", name=PASSWORD_LOGIN_NAME).first,
+        page.get_by_role("button", name=PASSWORD_LOGIN_NAME).first,
     ]
 
     for candidate in candidates:
@@ -162,14 +170,10 @@ def maybe_switch_to_password_login(page) -> bool:
 
 
 def wait_for_password_input(page, settings: Settings):
-    password_selector = (
-        "#password, [data-testid='login-password'], "
-        "input[type='password'], input[autocomplete='current-password']"
-    )
     deadline = monotonic() + (settings.login_timeout_ms / 1_000)
 
     while monotonic() < deadline:
-        password = page.locator(password_selector).first
+        password = page.locator(PASSWORD_SELECTOR).first
         try:
             password.wait_for(timeout=500)
             return password
@@ -222,6 +226,8 @@ def retrieve_code(write: bool = False, settings: Settings | None = None):
         raise ConfigError(
             "Browser authorization requires USERNAME/PASSWORD or SPOTIFY_USERNAME/SPOTIFY_PASSWORD."
         )
+    if settings.browser_session:
+        return retrieve_code_with_session(write=write, settings=settings)
 
     with sync_playwright() as p:
         browser = p.chromium.launch(slow_mo=settings.browser_slow_mo_ms)
@@ -230,17 +236,14 @@ def retrieve_code(write: bool = False, settings: Settings | None = None):
         try:
             page.goto(build_auth_code_url(settings), wait_until="domcontentloaded")
 
-            username_selector = "#username, [data-testid='login-username']"
-            login_button_selector = "[data-testid='login-button']"
-
-            username = page.locator(username_selector).first
+            username = page.locator(USERNAME_SELECTOR).first
             username.wait_for(timeout=settings.login_timeout_ms)
             username.fill(settings.username)
-            page.locator(login_button_selector).first.click()
+            page.locator(LOGIN_BUTTON_SELECTOR).first.click()
 
             password = wait_for_password_input(page, settings)
             password.fill(settings.password)
-            page.locator(login_button_selector).first.click()
+            page.locator(LOGIN_BUTTON_SELECTOR).first.click()
 
             redirect_pattern = f"{settings.redirect_uri}**"
             deadline = monotonic() + (settings.redirect_timeout_ms / 1_000)
@@ -258,24 +261,180 @@ def retrieve_code(write: bool = False, settings: Settings | None = None):
                     + describe_page_state(page)
                 )
 
-            code = parse_qs(urlparse(page.url).query).get("code", [None])[0]
-            if code is None:
-                raise RuntimeError(
-                    f"Spotify redirect did not include an authorization code: {page.url}"
-                )
+            return _auth_from_redirect(page.url, write, settings)
+        finally:
+            browser.close()
+
+
+def browser_state_file(settings: Settings) -> Path:
+    return BROWSER_STATE_DIR.joinpath(f"{settings.user_id}.json")
 
-            auth = {settings.user_id: {}}
-            auth[settings.user_id]["code"] = code
-            auth[settings.user_id]["scope"] = SCOPE
 
-            if write:
-                write_json(AUTH_FILE, auth)
+def _block_heavy_resources(route) -> None:
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        route.abort()
+    else:
+        route.continue_()
+
+
+def retrieve_code_with_session(write: bool = False, settings: Settings | None = None):
+    """Get an authorization code in headless Chromium, reusing the saved login.
+
+    Cookies and local storage are kept per user in ``BROWSER_STATE_DIR``, so
+    while Spotify's session lasts the authorize page goes straight to consent
+    or redirects at once. Login and consent screens are answered by locator
+    handlers as soon as they appear instead of being polled for, images,
+    fonts and media are never downloaded, and the redirect is answered
+    locally rather than loaded.
+    """
+    settings = settings or get_settings()
+    state_file = browser_state_file(settings)
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True)
+        context = browser.new_context(
+            storage_state=state_file if state_file.exists() else None
+        )
+        context.route("**/*", _block_heavy_resources)
+        context.route(
+            f"{settings.redirect_uri}**",
+            lambda route: route.fulfill(status=200, content_type="text/html", body=""),
+        )
+        page = context.new_page()
+        login_button = page.locator(LOGIN_BUTTON_SELECTOR).first
+
+        def submit(locator, value: str) -> None:
+            locator.fill(value)
+            login_button.click()
+
+        page.add_locator_handler(
+            page.locator(USERNAME_SELECTOR).first,
+            lambda locator: submit(locator, settings.username),
+            no_wait_after=True,
+            times=1,
+        )
+        page.add_locator_handler(
+            page.get_by_role("link", name=PASSWORD_LOGIN_NAME)
+            .or_(page.get_by_role("button", name=PASSWORD_LOGIN_NAME))
+            .first,
+            lambda locator: locator.click(),
+            no_wait_after=True,
+            times=1,
+        )
+        page.add_locator_handler(
+            page.locator(PASSWORD_SELECTOR).first,
+            lambda locator: submit(locator, settings.password),
+            no_wait_after=True,
+            times=1,
+        )
+        page.add_locator_handler(
+            page.locator(CONSENT_SELECTOR)
+            .or_(page.get_by_role("button", name=CONSENT_BUTTON_NAME))
+            .first,
+            lambda locator: locator.click(),
+        )
+        try:
+            page.goto(build_auth_code_url(settings), wait_until="commit")
+            try:
+                expect(page).to_have_url(
+                    re.compile("^" + re.escape(settings.redirect_uri)),
+                    timeout=settings.redirect_timeout_ms,
+                )
+            except AssertionError:
+                raise RuntimeError(
+                    "Spotify authorization did not redirect back to the configured "
+                    f"redirect URI within {settings.redirect_timeout_ms}ms. "
+                    + describe_page_state(page)
+                ) from None
 
-            return auth[settings.user_id]
+            state_file.parent.mkdir(parents=True, exist_ok=True)
+            context.storage_state(path=state_file)
+            state_file.chmod(0o600)
+            return _auth_from_redirect(page.url, write, settings)
         finally:
             browser.close()
 
 
+def _auth_from_redirect(url: str, write: bool, settings: Settings) -> dict:
+    code = parse_qs(urlparse(url).query).get("code", [None])[0]
+    if code is None:
+        raise RuntimeError(
+            f"Spotify redirect did not include an authorization code: {url}"
+        )
+
+    auth = {settings.user_id: {}}
+    auth[settings.user_id]["code"] = code
+    auth[settings.user_id]["scope"] = SCOPE
+
+    if write:
+        write_json(AUTH_FILE, auth)
+
+    return auth[settings.user_id]
+
+
+def listen_for_code(
+    settings: Settings | None = None,
+    *,
+    timeout: float = 300.0,
+    open_browser: bool = False,
+) -> str:
+    """Serve the redirect URI on its own host and port until Spotify calls it.
+
+    Prints the authorization URL (and opens it if ``open_browser``), answers
+    the single redirect and returns its ``code``. Needs a loopback ``http``
+    redirect URI such as ``http://127.0.0.1:8888/callback``.
+    """
+    settings = settings or get_settings()
+    redirect = urlparse(settings.redirect_uri)
+    if redirect.scheme != "http" or not redirect.hostname:
+        raise ConfigError(
+            "auth --listen needs an http REDIRECT_URI on this host, such as "
+            f"http://127.0.0.1:8888/callback; got {settings.redirect_uri}"
+        )
+    callback_path = redirect.path or "/"
+    query: dict[str, list[str]] = {}
+
+    class RedirectHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != callback_path:
+                self.send_error(404)
+                return
+            query.update(parse_qs(url.query))
+            body = b"esporifai received the authorization. You can close this tab."
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    address = (redirect.hostname, redirect.port or 80)
+    with HTTPServer(address, RedirectHandler) as server:
+        auth_url = build_auth_code_url(settings)
+        print(f"Open this URL to authorize esporifai:\n{auth_url}", file=sys.stderr)
+        if open_browser:
+            webbrowser.open(auth_url)
+
+        deadline = monotonic() + timeout
+        while not query:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise RuntimeError(
+                    f"No authorization redirect reached {settings.redirect_uri} "
+                    f"within {timeout:g}s."
+                )
+            server.timeout = remaining
+            server.handle_request()
+
+    if "code" not in query:
+        error = query.get("error", ["no code in redirect"])[0]
+        raise RuntimeError(f"Spotify authorization failed: {error}")
+    return query["code"][0]
+
+
 def request_token(
     code: str,
     write: bool = False,
@@ -297,16 +456,14 @@ def request_token(
         timeout=settings.request_timeout_seconds,
     )
     response.raise_for_status()
-    response_data = response.json()
+    response_data = loads(response.content)
 
     response_data["expires_at"] = dt.now() + timedelta(
         seconds=int(response_data["expires_in"])
     )
 
-    token_data = {settings.user_id: response_data}
-
     if write:
-        write_json(TOKEN_FILE, token_data)
+        token_store().put(settings.user_id, response_data)
 
     return response_data
 
@@ -331,17 +488,15 @@ def refresh_token(
         timeout=settings.request_timeout_seconds,
     )
     response.raise_for_status()
-    response_data = response.json()
+    response_data = loads(response.content)
 
     response_data["expires_at"] = dt.now() + timedelta(
         seconds=int(response_data["expires_in"])
     )
     response_data["refresh_token"] = refresh_token
 
-    token_data = {settings.user_id: response_data}
-
     if write:
-        write_json(TOKEN_FILE, token_data)
+        token_store().put(settings.user_id, response_data)
 
     return response_data
 
@@ -350,62 +505,71 @@ def handle_authorization(
     save_files: bool = False,
     force: bool = False,
     settings: Settings | None = None,
+    stale_token: str | None = None,
+    refresh_margin: float = 0.0,
 ):
+    """Return a usable token for ``settings.user_id``, refreshing it if needed.
+
+    ``stale_token`` is the access token a forced refresh is meant to replace.
+    If another process already saved a different token with more than
+    ``refresh_margin`` seconds left, that token is returned instead.
+    """
     settings = settings or get_settings()
+    store = token_store()
+    seen = store.get(settings.user_id)
+    if not force and seen and not is_expired(seen["expires_at"]):
+        return seen
+
+    # Refresh or log in under the user's lock. When many processes find the
+    # same stale token, the first one refreshes it and the others reread the
+    # token it saved instead of calling Spotify (or a browser) themselves.
+    with store.lock(settings.user_id):
+        token_info = store.get(settings.user_id)
+        if token_info and not is_expired(token_info["expires_at"]):
+            if not force:
+                return token_info
+            if stale_token is None:
+                if token_info != seen:
+                    return token_info
+            elif token_info["access_token"] != stale_token and not expires_within(
+                token_info["expires_at"], refresh_margin
+            ):
+                return token_info
+
+        token_info = _authorize(token_info, force, save_files, settings)
+        if save_files:
+            store.write(settings.user_id, token_info)
+        return token_info
+
+
+def _authorize(
+    token_info: dict | None, force: bool, save_files: bool, settings: Settings
+) -> dict:
     if force:
-        token_info = load_json(TOKEN_FILE).get(settings.user_id)
         if settings.spotify_refresh_token:
-            return refresh_token(
-                settings.spotify_refresh_token,
-                write=save_files,
-                settings=settings,
-            )
+            return refresh_token(settings.spotify_refresh_token, settings=settings)
         if token_info and token_info.get("refresh_token"):
-            return refresh_token(
-                token_info["refresh_token"],
-                write=save_files,
-                settings=settings,
-            )
+            return refresh_token(token_info["refresh_token"], settings=settings)
         auth = retrieve_code(write=save_files, settings=settings)
-        token_info = request_token(auth["code"], write=save_files, settings=settings)
-        return token_info
+        return request_token(auth["code"], settings=settings)
 
-    token_info = load_json(TOKEN_FILE).get(settings.user_id)
-    if token_info:
-        if not is_expired(token_info["expires_at"]):
-            return token_info
-        if token_info.get("refresh_token"):
-            return refresh_token(
-                token_info["refresh_token"],
-                write=save_files,
-                settings=settings,
-            )
+    if token_info and token_info.get("refresh_token"):
+        return refresh_token(token_info["refresh_token"], settings=settings)
 
     if settings.spotify_refresh_token:
-        return refresh_token(
-            settings.spotify_refresh_token,
-            write=save_files,
-            settings=settings,
-        )
-
-    auth = load_json(AUTH_FILE).get(settings.user_id)
-    if auth and auth.get("scope") == SCOPE:
-        # Spotify authorization codes are single-use, so retrieve a fresh one
-        # whenever we need to mint a new token.
-        auth = retrieve_code(write=save_files, settings=settings)
-    else:
-        auth = retrieve_code(write=save_files, settings=settings)
+        return refresh_token(settings.spotify_refresh_token, settings=settings)
 
-    token_info = request_token(auth["code"], write=save_files, settings=settings)
-
-    return token_info
+    # Spotify authorization codes are single-use, so retrieve a fresh one
+    # whenever we need to mint a new token.
+    auth = retrieve_code(write=save_files, settings=settings)
+    return request_token(auth["code"], settings=settings)
 
 
 def handle_response(
     response: httpx.Response,
 ):
     if response.status_code == 200:
-        return response.json()
+        return loads(response.content)
     else:
         print(f"Error {response.status_code}: {response.text}")
         raise Exit()
@@ -422,15 +586,37 @@ def handle_data(
 
     if output != Path("-"):
         filename = output.with_suffix(".json")
-        with open(filename, "w") as file:
-            json.dump(data, file, indent=2, default=str)
+        filename.write_text(dumps_pretty(data), encoding="utf-8")
 
     return data
 
 
+def stream_items(items: Iterable, output: Path) -> int:
+    """Write ``items`` as a JSON array, one item per line, as they arrive.
+
+    Returns the number of items written. ``output`` of ``-`` writes to stdout.
+    """
+    if output == Path("-"):
+        return _write_items(items, sys.stdout)
+
+    with open(output.with_suffix(".json"), "w", encoding="utf-8") as file:
+        return _write_items(items, file)
+
+
+def _write_items(items: Iterable, file) -> int:
+    count = 0
+    file.write("[")
+    for item in items:
+        file.write(",\n" if count else "\n")
+        file.write(dumps(item, default=str))
+        count += 1
+    file.write("\n]\n" if count else "]\n")
+    return count
+
+
 def handle_id_file(filepath: Path):
     spotify_id_re = re.compile("[a-zA-Z0-9]{22}")
-    with open(filepath, "r") as file:
+    with open(filepath) as file:
         contents = file.readlines()
 
     ids = []
@@ -1,14 +1,37 @@
+import asyncio
+import io
 import json
 import os
+import socket
+import threading
+import time
+from datetime import datetime as dt
+from datetime import timedelta
 from pathlib import Path
 from urllib.parse import parse_qs, urlparse
 
+import httpx
 import pytest
 from typer.testing import CliRunner
-from esporifai import cli, __app_name__, __version__
-from esporifai.config import get_settings
+
+from esporifai import (
+    aio,
+    api,
+    bulk,
+    cache,
+    catalog,
+    cli,
+    history,
+    ratelimit,
+    serialization,
+    sync,
+    tokens,
+    tokenstore,
+    utils,
+)
+from esporifai import compact as compact_events
+from esporifai.config import Settings, get_client_settings, get_settings
 from esporifai.history import HistoryInputKind, normalize_history_payload
-from esporifai import utils
 
 runner = CliRunner()
 integration = pytest.mark.integration
@@ -17,8 +40,16 @@ integration = pytest.mark.integration
 @pytest.fixture(autouse=True)
 def clear_settings_cache():
     get_settings.cache_clear()
+    get_client_settings.cache_clear()
     yield
     get_settings.cache_clear()
+    get_client_settings.cache_clear()
+
+
+def mock_client(monkeypatch, handler, **kwargs):
+    client = api.SpotifyClient(transport=httpx.MockTransport(handler), **kwargs)
+    monkeypatch.setattr(api, "get_client", lambda: client)
+    return client
 
 
 def require_spotify_env():
@@ -114,6 +145,201 @@ def test_auth_check_command_skips_authorization(monkeypatch):
     assert "True" in result.output
 
 
+def test_retrieve_code_with_session_reuses_state_and_blocks_resources(
+    monkeypatch, tmp_path
+):
+    class FakeLocator:
+        def __init__(self, page, name):
+            self.page = page
+            self.name = name
+            self.first = self
+
+        def or_(self, other):
+            return FakeLocator(self.page, f"{self.name}|{other.name}")
+
+        def fill(self, value):
+            self.page.calls.append(("fill", self.name, value))
+
+        def click(self):
+            self.page.calls.append(("click", self.name))
+
+    class FakePage:
+        def __init__(self):
+            self.calls = []
+            self.handlers = []
+            self.url = "about:blank"
+
+        def locator(self, selector):
+            return FakeLocator(self, selector)
+
+        def get_by_role(self, role, name=None):
+            return FakeLocator(self, role)
+
+        def add_locator_handler(self, locator, handler, **kwargs):
+            self.handlers.append((locator, handler, kwargs))
+
+        def goto(self, url, wait_until=None):
+            self.calls.append(("goto", wait_until))
+
+    class FakeContext:
+        def __init__(self, page, storage_state):
+            self.page = page
+            self.storage_state_in = storage_state
+            self.routes = []
+
+        def route(self, pattern, handler):
+            self.routes.append((pattern, handler))
+
+        def new_page(self):
+            return self.page
+
+        def storage_state(self, path):
+            Path(path).write_text("{}")
+
+    class FakeBrowser:
+        def __init__(self, page):
+            self.page = page
+            self.contexts = []
+
+        def new_context(self, storage_state=None):
+            self.contexts.append(FakeContext(self.page, storage_state))
+            return self.contexts[-1]
+
+        def close(self):
+            pass
+
+    class FakePlaywright:
+        def __init__(self, browser):
+            self.chromium = self
+            self.browser = browser
+            self.launches = []
+
+        def launch(self, **kwargs):
+            self.launches.append(kwargs)
+            return self.browser
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
+
+    class FakeExpect:
+        def __init__(self, page):
+            self.page = page
+
+        def to_have_url(self, pattern, timeout=None):
+            # Every login and consent screen shows up once before the redirect.
+            for locator, handler, _ in self.page.handlers:
+                handler(locator)
+            self.page.url = "https://example.com/callback?code=fast-code"
+            assert pattern.match(self.page.url)
+
+    class FakeRoute:
+        def __init__(self, resource_type):
+            self.request = type("Request", (), {"resource_type": resource_type})
+            self.action = None
+
+        def abort(self):
+            self.action = "abort"
+
+        def continue_(self):
+            self.action = "continue"
+
+    page = FakePage()
+    browser = FakeBrowser(page)
+    playwright = FakePlaywright(browser)
+    monkeypatch.setattr(utils, "sync_playwright", lambda: playwright)
+    monkeypatch.setattr(utils, "expect", FakeExpect)
+    monkeypatch.setattr(utils, "BROWSER_STATE_DIR", tmp_path / "browser")
+    monkeypatch.setattr(utils, "AUTH_FILE", tmp_path / "auth.json")
+    monkeypatch.setenv("SPOTIFY_CLIENT_ID", "client-id")
+    monkeypatch.setenv("SPOTIFY_AUTH_STRING", "auth-string")
+    monkeypatch.setenv("REDIRECT_URI", "https://example.com/callback")
+    monkeypatch.setenv("USERNAME", "sergio")
+    monkeypatch.setenv("PASSWORD", "secret")
+    monkeypatch.setenv("ESPORIFAI_BROWSER_SESSION", "1")
+
+    assert utils.retrieve_code()["code"] == "fast-code"
+    assert utils.retrieve_code()["code"] == "fast-code"
+
+    settings = get_settings()
+    state_file = utils.browser_state_file(settings)
+    assert playwright.launches == [{"headless": True}] * 2
+    assert browser.contexts[0].storage_state_in is None
+    assert browser.contexts[1].storage_state_in == state_file
+    assert ("fill", utils.USERNAME_SELECTOR, "sergio") in page.calls
+    assert ("fill", utils.PASSWORD_SELECTOR, "secret") in page.calls
+
+    block = browser.contexts[0].routes[0][1]
+    image, script = FakeRoute("image"), FakeRoute("script")
+    block(image)
+    block(script)
+    assert (image.action, script.action) == ("abort", "continue")
+
+
+def test_listen_for_code_captures_redirect(tmp_path):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    settings = Settings(
+        "client-id", "auth-string", f"http://127.0.0.1:{port}/callback", None, None
+    )
+    result = {}
+
+    def listen():
+        result["code"] = utils.listen_for_code(settings, timeout=5)
+
+    listener = threading.Thread(target=listen)
+    listener.start()
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            missing = httpx.get(f"{base}/favicon.ico")
+            break
+        except httpx.ConnectError:
+            time.sleep(0.02)
+    response = httpx.get(f"{base}/callback", params={"code": "loopback-code"})
+    listener.join(5)
+
+    assert missing.status_code == 404
+    assert response.status_code == 200
+    assert result["code"] == "loopback-code"
+
+
+def test_auth_listen_exchanges_captured_code(monkeypatch, tmp_path):
+    monkeypatch.setenv("SPOTIFY_CLIENT_ID", "client-id")
+    monkeypatch.setenv("SPOTIFY_AUTH_STRING", "auth-string")
+    monkeypatch.setenv("REDIRECT_URI", "http://127.0.0.1:8888/callback")
+    monkeypatch.setenv("SPOTIFY_REFRESH_TOKEN", "refresh-token")
+    monkeypatch.setattr(cli, "AUTH_FILE", tmp_path / "auth.json")
+    monkeypatch.setattr(cli, "token_manager", None)
+    monkeypatch.setattr(
+        cli, "listen_for_code", lambda timeout, open_browser: "listened-code"
+    )
+    exchanged = []
+    monkeypatch.setattr(
+        cli,
+        "request_token",
+        lambda code, write, settings: exchanged.append(code) or {"access_token": "t"},
+    )
+    monkeypatch.setattr(cli, "get_auth_status", lambda settings: {})
+
+    result = runner.invoke(cli.cli, ["auth", "--listen"])
+
+    assert result.exit_code == 0
+    assert exchanged == ["listened-code"]
+
+
+def test_listen_for_code_requires_http_redirect_uri():
+    settings = Settings(
+        "client-id", "auth-string", "https://example.com/callback", None, None
+    )
+
+    with pytest.raises(utils.ConfigError, match="--listen"):
+        utils.listen_for_code(settings, timeout=1)
+
+
 def test_build_auth_code_url_uses_standard_authorize_query(monkeypatch):
     monkeypatch.setenv("SPOTIFY_CLIENT_ID", "client-id")
     monkeypatch.setenv("SPOTIFY_AUTH_STRING", "auth-string")
@@ -293,6 +519,497 @@ def test_retrieve_code_handles_two_step_login(monkeypatch, tmp_path):
     assert utils.AUTH_FILE.exists()
 
 
+def test_api_functions_share_one_pooled_client(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"id": request.url.path.rsplit("/", 1)[-1]})
+
+    mock_client(monkeypatch, handler)
+
+    assert api.get_track("token", "track1").json() == {"id": "track1"}
+    assert api.get_artist("token", "artist1").json() == {"id": "artist1"}
+    assert [request.url.path for request in requests] == [
+        "/v1/tracks/track1",
+        "/v1/artists/artist1",
+    ]
+    assert requests[0].headers["Authorization"] == "Bearer token"
+
+
+def test_endpoint_subclass_without_transport_fails_at_instantiation():
+    class Incomplete(api.SpotifyEndpoints):
+        def get(self, access_token, path, params=None, headers=None):
+            return None
+
+    with pytest.raises(TypeError, match="get_item"):
+        Incomplete()
+
+
+def test_client_settings_read_pool_options_from_env(monkeypatch):
+    monkeypatch.setenv("ESPORIFAI_MAX_CONNECTIONS", "4")
+    monkeypatch.setenv("ESPORIFAI_HTTP2", "true")
+
+    settings = get_client_settings()
+
+    assert settings.max_connections == 4
+    assert settings.http2 is True
+
+
+def several_handler(key, requests):
+    def handler(request):
+        ids = request.url.params["ids"].split(",")
+        requests.append(ids)
+        return httpx.Response(
+            200,
+            json={key: [None if _id.startswith("x") else {"id": _id} for _id in ids]},
+        )
+
+    return handler
+
+
+def test_get_several_tracks_chunks_ids_and_merges_in_order(monkeypatch):
+    requests = []
+    mock_client(monkeypatch, several_handler("tracks", requests))
+    track_ids = [f"t{index}" for index in range(120)]
+    track_ids[7] = "xunknown"
+
+    tracks = api.get_several_tracks("token", track_ids).json()["tracks"]
+
+    assert sorted(len(chunk) for chunk in requests) == [20, 50, 50]
+    assert tracks[7] is None
+    assert [track["id"] for track in tracks if track] == [
+        _id for _id in track_ids if _id != "xunknown"
+    ]
+
+
+def test_async_get_several_audio_features_uses_batch_limit():
+    requests = []
+
+    async def run():
+        async with aio.AsyncSpotifyClient(
+            transport=httpx.MockTransport(several_handler("audio_features", requests))
+        ) as client:
+            return await client.get_several_tracks_audio_features(
+                "token", [f"t{index}" for index in range(250)]
+            )
+
+    response = asyncio.run(run())
+
+    assert sorted(len(chunk) for chunk in requests) == [50, 100, 100]
+    assert len(response.json()["audio_features"]) == 250
+
+
+def test_several_tracks_only_requests_cache_misses(monkeypatch, tmp_path):
+    requests = []
+    response_cache = cache.ResponseCache(tmp_path / "cache.sqlite3")
+    mock_client(monkeypatch, several_handler("tracks", requests), cache=response_cache)
+
+    api.get_several_tracks("token", ["t1", "t2"])
+    tracks = api.get_several_tracks("token", ["t2", "t3", "t1"]).json()["tracks"]
+
+    assert requests == [["t1", "t2"], ["t3"]]
+    assert [track["id"] for track in tracks] == ["t2", "t3", "t1"]
+    assert response_cache.get("tracks", "t3") is not None
+
+
+def test_cached_item_is_revalidated_with_etag(monkeypatch, tmp_path):
+    response_cache = cache.ResponseCache(
+        tmp_path / "cache.sqlite3", ttls={"audio-analysis": 0}
+    )
+    seen_headers = []
+
+    def handler(request):
+        seen_headers.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json={"track": {}}, headers={"ETag": '"v1"'})
+
+    mock_client(monkeypatch, handler, cache=response_cache, memo_ttl=0)
+
+    first = api.get_track_audio_analysis("token", "track1")
+    second = api.get_track_audio_analysis("token", "track1")
+
+    assert seen_headers == [None, '"v1"']
+    assert first.json() == second.json() == {"track": {}}
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    response_cache = cache.ResponseCache(tmp_path / "cache.sqlite3", max_bytes=25)
+    response_cache.put("tracks", "old", "x" * 10)
+    response_cache.put("tracks", "new", "y" * 10)
+    response_cache.get("tracks", "old")
+    response_cache.put("tracks", "newest", "z" * 10)
+
+    assert response_cache.get("tracks", "new") is None
+    assert response_cache.get("tracks", "old") is not None
+
+
+def test_duplicate_item_lookups_are_coalesced(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        if "ids" in request.url.params:
+            ids = request.url.params["ids"].split(",")
+            return httpx.Response(200, json={"tracks": [{"id": _id} for _id in ids]})
+        return httpx.Response(200, json={"id": request.url.path.rsplit("/", 1)[-1]})
+
+    mock_client(monkeypatch, handler)
+
+    for _id in ["a", "b", "a", "a"]:
+        assert api.get_track_audio_features("token", _id).json() == {"id": _id}
+    tracks = api.get_several_tracks("token", ["c", "c", "d"])
+
+    assert requests == ["/v1/audio-features/a", "/v1/audio-features/b", "/v1/tracks"]
+    assert [track["id"] for track in tracks.json()["tracks"]] == ["c", "c", "d"]
+
+
+def test_client_memo_is_bounded_by_response_bytes(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        return httpx.Response(200, json={"segments": "x" * 1000})
+
+    client = mock_client(monkeypatch, handler, memo_max_bytes=2500)
+
+    for _id in ["a", "b", "c", "a"]:
+        api.get_track_audio_analysis("token", _id)
+
+    memo = client._flights._recent
+    assert len(memo) == 2 and memo.total_bytes <= 2500
+    assert requests[-1] == "/v1/audio-analysis/a"
+    assert len(requests) == 4
+
+
+def test_async_duplicate_lookups_share_one_request():
+    requests = []
+
+    async def handler(request):
+        requests.append(request.url.path)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"id": "a"})
+
+    async def run():
+        async with aio.AsyncSpotifyClient(
+            transport=httpx.MockTransport(handler)
+        ) as client:
+            return await asyncio.gather(
+                *(client.get_track_audio_analysis("token", "a") for _ in range(5))
+            )
+
+    responses = asyncio.run(run())
+
+    assert requests == ["/v1/audio-analysis/a"]
+    assert all(response.json() == {"id": "a"} for response in responses)
+
+
+def test_iter_user_top_items_follows_next_urls(monkeypatch):
+    def handler(request):
+        offset = int(request.url.params["offset"])
+        next_url = (
+            f"https://api.spotify.com/v1/me/top/tracks?offset={offset + 2}&limit=2"
+            if offset < 4
+            else None
+        )
+        return httpx.Response(
+            200,
+            json={"items": [{"rank": offset}, {"rank": offset + 1}], "next": next_url},
+        )
+
+    mock_client(monkeypatch, handler)
+
+    items = api.iter_user_top_items("token", "tracks", limit=2)
+
+    assert [item["rank"] for item in items] == [0, 1, 2, 3, 4, 5]
+    assert len(list(api.iter_user_top_items("token", "tracks", max_items=3))) == 3
+
+
+def test_paginate_stops_fetching_when_max_items_ends_a_page(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.params["offset"])
+        offset = int(request.url.params["offset"])
+        next_url = f"https://api.spotify.com/v1/me/top/tracks?offset={offset + 2}"
+        return httpx.Response(
+            200,
+            json={"items": [{"rank": offset}, {"rank": offset + 1}], "next": next_url},
+        )
+
+    mock_client(monkeypatch, handler)
+
+    items = list(api.iter_user_top_items("token", "tracks", limit=2, max_items=4))
+
+    assert [item["rank"] for item in items] == [0, 1, 2, 3]
+    assert requests == ["0", "2"]
+
+
+def test_get_recently_played_all_streams_every_page(monkeypatch, tmp_path):
+    pages = {
+        "1000": {
+            "items": [{"played_at": "c"}, {"played_at": "b"}],
+            "cursors": {"before": "900"},
+        },
+        "900": {"items": [{"played_at": "a"}], "cursors": {"before": "800"}},
+        "800": {"items": [], "cursors": None},
+    }
+    mock_client(
+        monkeypatch,
+        lambda request: httpx.Response(200, json=pages[request.url.params["before"]]),
+    )
+    monkeypatch.setattr(cli, "ensure_access_token", lambda: "token")
+
+    output = tmp_path / "played.json"
+    result = runner.invoke(
+        cli.cli,
+        [
+            "get-recently-played",
+            "before",
+            "1970-01-01T00:00:01",
+            "--time-zone",
+            "UTC",
+            "--all",
+            "--output",
+            str(output),
+        ],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert [item["played_at"] for item in json.loads(output.read_text())] == [
+        "c",
+        "b",
+        "a",
+    ]
+
+
+def test_get_top_rejects_trim_with_max_items(monkeypatch, tmp_path):
+    monkeypatch.setattr(cli, "ensure_access_token", lambda: "token")
+    output = tmp_path / "top.json"
+
+    result = runner.invoke(
+        cli.cli,
+        ["get-top", "tracks", "--max-items", "5", "--trim", "-o", str(output)],
+    )
+
+    assert result.exit_code == 2
+    assert "--trim" in result.output
+    assert not output.exists()
+
+
+def test_sync_recently_played_appends_only_new_plays(monkeypatch, tmp_path):
+    def play(played_at, track_id):
+        return {"played_at": played_at, "track": {"id": track_id}}
+
+    plays = [
+        play("2026-06-26T12:00:00.000Z", "t1"),
+        play("2026-06-26T12:05:00.000Z", "t2"),
+    ]
+    requests = []
+
+    def handler(request):
+        after = int(request.url.params["after"])
+        requests.append(after)
+        newer = [item for item in plays if sync.played_at_ms(item["played_at"]) > after]
+        return httpx.Response(200, json={"items": newer[::-1], "cursors": None})
+
+    mock_client(monkeypatch, handler)
+    output = tmp_path / "plays.jsonl"
+    state_file = tmp_path / "sync_state.json"
+
+    first = sync.sync_recently_played("token", "user", output, state_file)
+    second = sync.sync_recently_played("token", "user", output, state_file)
+    plays.append(play("2026-06-26T12:09:00.000Z", "t3"))
+    third = sync.sync_recently_played("token", "user", output, state_file)
+
+    lines = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [line["track"]["id"] for line in lines] == ["t1", "t2", "t3"]
+    assert (first["new"], second["new"], third["new"]) == (2, 0, 1)
+    assert requests == [0, first["after"], first["after"]]
+
+
+def test_sync_recently_played_resumes_after_crash_without_duplicates(
+    monkeypatch, tmp_path
+):
+    plays = [
+        {"played_at": "2026-06-26T12:00:00.000Z", "track": {"id": "t1"}},
+        {"played_at": "2026-06-26T12:05:00.000Z", "track": {"id": "t2"}},
+    ]
+
+    def handler(request):
+        after = int(request.url.params["after"])
+        newer = [item for item in plays if sync.played_at_ms(item["played_at"]) > after]
+        return httpx.Response(200, json={"items": newer[::-1], "cursors": None})
+
+    mock_client(monkeypatch, handler)
+    output = tmp_path / "plays.jsonl"
+    state_file = tmp_path / "sync_state.json"
+    # A run that died after appending but before saving its cursor, mid-line.
+    output.write_text(json.dumps(plays[0]) + "\n" + json.dumps(plays[1])[:10])
+    pending = {"output": str(output), "size": 0}
+    state_file.write_text(json.dumps({"user": {"after": 0, "pending": pending}}))
+
+    result = sync.sync_recently_played("token", "user", output, state_file)
+
+    lines = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [line["track"]["id"] for line in lines] == ["t1", "t2"]
+    assert result["new"] == 1
+    assert result["after"] == sync.played_at_ms(plays[1]["played_at"])
+    assert "pending" not in json.loads(state_file.read_text())["user"]
+    assert sync.user_lock_file(state_file, "user").exists()
+
+
+def test_run_bulk_records_failures_and_resumes(tmp_path):
+    calls = []
+    broken = {"b"}
+
+    async def fetch(batch):
+        calls.extend(batch)
+        (item_id,) = batch
+        if item_id in broken:
+            raise bulk.BulkFetchError("Error 500: boom")
+        return {item_id: {"id": item_id}}
+
+    def run(ids):
+        return asyncio.run(
+            bulk.run_bulk(ids, fetch, tmp_path, endpoint="get_track", workers=2)
+        )
+
+    first = run(["a", "b", "c", "a"])
+    broken.clear()
+    second = run(["a", "b", "c"])
+
+    assert (first.completed, first.failed) == (2, 1)
+    assert (second.completed, second.failed, second.skipped) == (1, 0, 2)
+    assert sorted(calls) == ["a", "b", "b", "c"]
+    assert json.loads((tmp_path / "b.json").read_text()) == {"id": "b"}
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_run_bulk_keeps_endpoints_apart_in_one_directory(tmp_path):
+    async def analysis(batch):
+        return {item_id: {"analysis": item_id} for item_id in batch}
+
+    async def features(batch):
+        return {item_id: {"features": item_id} for item_id in batch}
+
+    first = asyncio.run(
+        bulk.run_bulk(["a", "b"], analysis, tmp_path, endpoint="analysis")
+    )
+    second = asyncio.run(
+        bulk.run_bulk(["a", "b"], features, tmp_path, endpoint="features")
+    )
+
+    assert (first.completed, second.completed, second.skipped) == (2, 2, 0)
+    assert first.manifest != second.manifest
+    assert json.loads((tmp_path / "a.json").read_text()) == {"features": "a"}
+
+
+def test_bulk_clients_do_not_memoize_responses(monkeypatch, tmp_path):
+    built = []
+    from_settings = aio.AsyncSpotifyClient.from_settings.__func__
+
+    def record(cls, settings, **kwargs):
+        built.append(kwargs)
+        kwargs["transport"] = httpx.MockTransport(
+            lambda request: httpx.Response(200, json={"id": "a"})
+        )
+        return from_settings(cls, settings, **kwargs)
+
+    monkeypatch.setattr(aio.AsyncSpotifyClient, "from_settings", classmethod(record))
+    monkeypatch.setenv("ESPORIFAI_CACHE", "0")
+    settings = get_client_settings()
+
+    bulk.bulk_fetch_items("get_track", "token", ["a"], tmp_path, settings=settings)
+    aio.run_each(
+        "get_track", "token", ["a"], lambda _id, response: None, settings=settings
+    )
+
+    assert [kwargs["memo_ttl"] for kwargs in built] == [0, 0]
+
+
+def test_get_audio_features_file_uses_batch_endpoint(monkeypatch, tmp_path):
+    requests = []
+    mock_client(monkeypatch, several_handler("audio_features", requests))
+    monkeypatch.setattr(cli, "ensure_access_token", lambda: "token")
+    ids = [f"{index:022d}" for index in range(150)]
+    id_file = tmp_path / "ids.txt"
+    id_file.write_text("\n".join(ids) + "\n")
+
+    result = runner.invoke(
+        cli.cli,
+        ["get-audio-features", "--id", "-", "--file", str(id_file), "--output", "-"],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert [len(chunk) for chunk in requests] == [100, 50]
+    assert [json.loads(line)["id"] for line in result.output.splitlines()] == ids
+
+
+def test_client_retries_throttled_requests_after_retry_after(monkeypatch):
+    responses = [
+        httpx.Response(429, headers={"Retry-After": "0"}),
+        httpx.Response(200, json={"id": "track1"}),
+    ]
+    client = mock_client(monkeypatch, lambda request: responses.pop(0), concurrency=4)
+
+    response = api.get_track("token", "track1")
+
+    assert response.status_code == 200
+    assert responses == []
+    assert client._gate.value < 4
+
+
+def test_client_gives_up_when_retry_after_exceeds_limit(monkeypatch):
+    mock_client(
+        monkeypatch,
+        lambda request: httpx.Response(429, headers={"Retry-After": "3600"}),
+        scheduler=ratelimit.RequestScheduler(max_retry_wait=60),
+    )
+
+    assert api.get_track("token", "track1").status_code == 429
+
+
+def test_token_bucket_budget_is_shared_through_state_file(tmp_path):
+    state_file = tmp_path / "rate_limit.json"
+    first = ratelimit.TokenBucket(rate=1.0, capacity=1.0, state_file=state_file)
+    second = ratelimit.TokenBucket(rate=1.0, capacity=1.0, state_file=state_file)
+
+    assert first.reserve() == 0.0
+    assert second.reserve() == pytest.approx(1.0, abs=0.1)
+
+
+def test_async_client_limits_concurrency_and_preserves_order():
+    in_flight = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, json={"id": request.url.path.rsplit("/", 1)[-1]})
+
+    seen = []
+
+    async def run():
+        async with aio.AsyncSpotifyClient(
+            concurrency=2, transport=httpx.MockTransport(handler)
+        ) as client:
+            await aio.fetch_each(
+                lambda _id: client.get_track_audio_analysis("token", _id),
+                ["a", "b", "c", "d", "e"],
+                lambda _id, response: seen.append((_id, response.json()["id"])),
+            )
+
+    asyncio.run(run())
+
+    assert seen == [(_id, _id) for _id in "abcde"]
+    assert peak == 2
+
+
 def test_normalize_recently_played_payload_extracts_catalogs():
     payload = {
         "items": [
@@ -322,6 +1039,11 @@ def test_normalize_recently_played_payload_extracts_catalogs():
         payload, HistoryInputKind.recently_played, "api_source"
     )
 
+    # Records are returned finalized, not only through the *_records accessors.
+    event = history.events[("2026-06-26T12:00:00.000Z", "track123")]
+    assert event["sources"] == ["api_source"]
+    assert history.tracks["track123"]["sources"] == ["api_source"]
+    json.dumps([list(history.events.values()), history.tracks, history.albums])
     assert history.event_records() == [
         {
             "played_at": "2026-06-26T12:00:00.000Z",
@@ -335,6 +1057,24 @@ def test_normalize_recently_played_payload_extracts_catalogs():
     assert history.artist_records()[0]["name"] == "Artist One"
 
 
+def test_normalize_history_files_returns_finalized_records(tmp_path):
+    for name, source_row in (("a.json", "x"), ("b.json", "y")):
+        (tmp_path / name).write_text(
+            json.dumps([{"ts": "2018-01-10T19:46:56Z", "track_id": source_row}])
+        )
+    paths = [tmp_path / "a.json", tmp_path / "b.json"]
+
+    for workers in (1, 2):
+        normalized = history.normalize_history_files(
+            paths, HistoryInputKind.export, "export", workers=workers
+        )
+        assert all(
+            isinstance(record["sources"], list)
+            for records in (normalized.events, normalized.tracks)
+            for record in records.values()
+        )
+
+
 def test_normalize_export_payload_preserves_export_only_track_ids():
     payload = [
         {
@@ -411,6 +1151,439 @@ def test_normalize_history_command_writes_jsonl_and_catalogs(tmp_path):
     assert json.loads(result.output)["events"] == 1
 
 
+def test_json_item_stream_yields_entries_with_small_buffers():
+    payload = {
+        "href": "https://example.com",
+        "cursors": {"after": "1", "before": "0"},
+        "items": [{"n": 12345, "s": "a, b ] }"}, [1, 2], 67890, "x"],
+        "limit": 50,
+    }
+    text = json.dumps(payload, indent=1)
+
+    for chunk_size in (1, 3, 64):
+        stream = history.JsonItemStream(io.StringIO(text), chunk_size=chunk_size)
+        assert list(stream) == payload["items"]
+    assert list(history.JsonItemStream(io.StringIO("[]"))) == []
+
+
+def test_normalize_history_command_reads_export_from_stdin():
+    rows = [
+        {"ts": "2018-01-10T19:46:56Z", "spotify_track_uri": "spotify:track:abc"},
+        {"ts": "2018-01-10T19:46:56Z", "spotify_track_uri": "spotify:track:abc"},
+        "not a row",
+    ]
+
+    result = runner.invoke(
+        cli.cli,
+        ["normalize-history", "export", "--input", "-"],
+        input=json.dumps(rows),
+    )
+
+    assert result.exit_code == 0, result.output
+    assert [json.loads(line) for line in result.output.splitlines()] == [
+        {
+            "played_at": "2018-01-10T19:46:56Z",
+            "sources": ["spotify_history"],
+            "track_id": "abc",
+        }
+    ]
+
+
+def test_normalize_history_command_merges_directory_like_single_process(tmp_path):
+    exports = tmp_path / "export"
+    exports.mkdir()
+    files = [
+        [
+            {"ts": "2018-01-10T19:46:56Z", "spotify_track_uri": "spotify:track:abc"},
+            {"ts": "2018-01-11T08:00:00Z", "spotify_track_uri": "spotify:track:def"},
+        ],
+        [
+            {
+                "ts": "2018-01-11T08:00:00Z",
+                "spotify_track_uri": "spotify:track:def",
+                "master_metadata_track_name": "Late Name",
+            },
+            {
+                "ts": "2018-01-12T08:00:00Z",
+                "spotify_track_uri": "spotify:track:abc",
+                "master_metadata_track_name": "First Name",
+            },
+        ],
+    ]
+    for index, rows in enumerate(files):
+        utils.write_json(exports / f"Streaming_History_Audio_{index}.json", rows)
+    (exports / "notes.txt").write_text("ignored")
+
+    outputs = {}
+    for workers in ("1", "2"):
+        catalog = tmp_path / f"catalog-{workers}"
+        result = runner.invoke(
+            cli.cli,
+            [
+                "normalize-history",
+                "export",
+                "--input",
+                str(exports),
+                "--workers",
+                workers,
+                "--sort-buffer",
+                workers,
+                "--catalog-dir",
+                str(catalog),
+                *(["--compact"] if workers == "2" else []),
+            ],
+        )
+        assert result.exit_code == 0, result.output
+        outputs[workers] = (
+            result.output,
+            (catalog / "track_catalog.jsonl").read_text(),
+        )
+
+    assert outputs["1"] == outputs["2"]
+    assert len(outputs["2"][0].splitlines()) == 3
+    tracks = [json.loads(line) for line in outputs["2"][1].splitlines()]
+    assert [(track["id"], track.get("name")) for track in tracks] == [
+        ("abc", "First Name"),
+        ("def", "Late Name"),
+    ]
+
+    result = runner.invoke(
+        cli.cli,
+        ["normalize-history", "export", "--input", str(exports / "*_1.json")],
+    )
+    assert result.exit_code == 0, result.output
+    assert len(result.output.splitlines()) == 2
+
+
+def test_normalize_history_command_rejects_empty_input_pattern(tmp_path):
+    result = runner.invoke(
+        cli.cli,
+        ["normalize-history", "export", "--input", str(tmp_path / "*.json")],
+    )
+
+    assert result.exit_code != 0
+    assert "No input files found" in result.output
+
+
+def test_sorted_lines_spills_runs_with_identical_output():
+    normalized = history.NormalizedHistory()
+    for index in (5, 3, 9, 1, 7, 2, 8):
+        normalized.add_event(f"2020-01-0{index}T00:00:00Z", f"t{index % 3}", "api")
+        normalized.tracks[f"t{index}"] = {"id": f"t{index}", "name": "Café\tTab"}
+
+    expected = history.sorted_jsonl(normalized.event_records())
+    for buffer_size in (1, 2, 3, 100):
+        assert "".join(history.sorted_lines(normalized.events, buffer_size)) == (
+            expected
+        )
+    assert "".join(history.sorted_lines(normalized.tracks, 2)) == (
+        history.sorted_jsonl(normalized.track_records())
+    )
+    assert list(history.sorted_lines({}, 1)) == []
+
+
+def test_normalize_history_command_reads_and_writes_gzip(tmp_path):
+    import gzip
+
+    item = {
+        "played_at": "2024-01-01T00:00:00Z",
+        "track": {"id": "track-1", "name": "Song", "artists": []},
+    }
+    source = tmp_path / "recently_played.jsonl.gz"
+    with gzip.open(source, "wt", encoding="utf-8") as handle:
+        handle.write(json.dumps(item) + "\n")
+    output = tmp_path / "events.jsonl.gz"
+
+    result = runner.invoke(
+        cli.cli,
+        [
+            "normalize-history",
+            "recently-played",
+            "--input",
+            str(tmp_path),
+            "--output",
+            str(output),
+            "--catalog-dir",
+            str(tmp_path / "catalog"),
+            "--catalog-suffix",
+            ".jsonl.gz",
+        ],
+    )
+
+    assert result.exit_code == 0, result.output
+    with gzip.open(output, "rt", encoding="utf-8") as handle:
+        assert json.loads(handle.read())["track_id"] == "track-1"
+    catalog = tmp_path / "catalog" / "track_catalog.jsonl.gz"
+    rows = list(history.iter_history_rows(catalog))
+    assert [row["id"] for row in rows] == ["track-1"]
+
+
+def test_merge_catalog_updates_in_place_and_skips_unchanged(tmp_path):
+    path = tmp_path / "track_catalog.jsonl"
+    first = {
+        "a": {"id": "a", "metadata_status": "missing", "sources": ["export"]},
+        "c": {
+            "id": "c",
+            "name": "C",
+            "metadata_status": "partial",
+            "sources": ["api"],
+        },
+    }
+    assert catalog.merge_catalog(path, first).as_dict() == {"added": 2, "updated": 0}
+    assert path.with_name("track_catalog.jsonl.idx").exists()
+
+    stamp = os.stat(path).st_mtime_ns
+    unchanged = catalog.merge_catalog(path, {"c": dict(first["c"])})
+    assert not unchanged.changed
+    assert os.stat(path).st_mtime_ns == stamp
+
+    delta = {
+        "a": {
+            "id": "a",
+            "name": "A",
+            "metadata_status": "complete",
+            "sources": ["api"],
+        },
+        "b": {"id": "b", "sources": ["api"]},
+    }
+    assert catalog.merge_catalog(path, delta).as_dict() == {"added": 1, "updated": 1}
+
+    merged = history.NormalizedHistory()
+    for record in [*first.values(), *delta.values()]:
+        history.merge_record(merged.tracks, record)
+    assert path.read_text() == history.sorted_jsonl(merged.track_records())
+    assert catalog.CatalogIndex(path).load() == catalog.CatalogIndex(path).rebuild()
+
+
+def test_normalize_history_merge_without_catalog_dir_fails_before_reading(
+    monkeypatch, tmp_path
+):
+    def fail(*args, **kwargs):
+        raise AssertionError("inputs should not be normalized")
+
+    monkeypatch.setattr(cli, "normalize_history_files", fail)
+    export = tmp_path / "export.json"
+    export.write_text("[]")
+
+    result = runner.invoke(
+        cli.cli, ["normalize-history", "export", "--input", str(export), "--merge"]
+    )
+
+    assert result.exit_code == 2
+
+
+def test_store_ingest_upserts_with_merge_record_precedence(tmp_path):
+    import sqlite3
+
+    database = tmp_path / "history.sqlite3"
+    export = tmp_path / "export.json"
+    utils.write_json(
+        export,
+        [{"ts": "2024-01-01T00:00:00Z", "spotify_track_uri": "spotify:track:t1"}],
+    )
+    recent = tmp_path / "recent.json"
+    utils.write_json(
+        recent,
+        {
+            "items": [
+                {
+                    "played_at": "2024-01-01T00:00:00Z",
+                    "track": {
+                        "id": "t1",
+                        "name": "Song",
+                        "artists": [{"id": "a1", "name": "Artist"}],
+                    },
+                }
+            ]
+        },
+    )
+
+    def ingest(kind, path, source):
+        result = runner.invoke(
+            cli.cli,
+            [
+                "store",
+                "ingest",
+                kind,
+                "--input",
+                str(path),
+                "--database",
+                str(database),
+                "--source",
+                source,
+            ],
+        )
+        assert result.exit_code == 0, result.output
+        return json.loads(result.output)["changed"]
+
+    def counts(events, tracks, artists):
+        return {"albums": 0, "artists": artists, "events": events, "tracks": tracks}
+
+    assert ingest("export", export, "export") == counts(1, 1, 0)
+    assert ingest("recently-played", recent, "api") == counts(1, 1, 1)
+    assert ingest("recently-played", recent, "api") == counts(0, 0, 0)
+
+    db = sqlite3.connect(database)
+    assert db.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    events = db.execute("SELECT played_at, track_id, sources FROM events")
+    assert events.fetchall() == [("2024-01-01T00:00:00Z", "t1", '["api","export"]')]
+    assert db.execute(
+        "SELECT name, metadata_status FROM tracks WHERE id = 't1'"
+    ).fetchone() == ("Song", "complete")
+    plays = db.execute(
+        "SELECT COUNT(*) FROM events JOIN track_artists USING (track_id) "
+        "WHERE artist_id = 'a1'"
+    ).fetchone()
+    assert plays == (1,)
+    db.close()
+
+
+def test_compact_history_matches_dict_history():
+    plays = [
+        ("2024-01-01T00:00:00Z", "b", "export"),
+        ("2024-01-01T00:00:00.500Z", "b", "api"),
+        ("2024-01-01T00:00:00.050Z", "a", "api"),
+        ("2024-01-01T00:00:00Z", "a", "export"),
+        ("2024-01-01T00:00:00Z", "b", "api"),
+        ("2023-12-31T23:59:59Z", "c", "export"),
+        ("2024-01-01T00:00:00+00:00", "a", "export"),
+        ("2024-02-30T00:00:00Z", "a", "export"),
+    ]
+    regular = history.NormalizedHistory()
+    compact = history.NormalizedHistory.compact()
+    merged = history.NormalizedHistory.compact()
+    for play in plays:
+        regular.add_event(*play)
+        compact.add_event(*play)
+        part = history.NormalizedHistory.compact()
+        part.add_event(*play)
+        merged.merge(part)
+
+    expected = history.sorted_jsonl(regular.event_records())
+    assert history.sorted_jsonl(compact.event_records()) == expected
+    assert "".join(history.sorted_lines(compact.events, 2)) == expected
+    assert history.sorted_jsonl(merged.event_records()) == expected
+    assert compact.as_summary() == regular.as_summary()
+    # Repeated plays are folded into one row per event once the columns settle.
+    assert len(compact.events.played) + len(compact.events.other) == len(regular.events)
+    assert compact.events[("2024-01-01T00:00:00Z", "b")]["sources"] == [
+        "api",
+        "export",
+    ]
+    played_at = "1999-12-31T23:59:59.007Z"
+    assert (
+        compact_events.decode_played_at(compact_events.encode_played_at(played_at))
+        == played_at
+    )
+
+
+def test_history_sources_are_sorted_once_at_finalize():
+    normalized = history.NormalizedHistory()
+    normalized.add_event("2024-01-01T00:00:00Z", "t1", "zeta")
+    normalized.add_event("2024-01-01T00:00:00Z", "t1", "alpha")
+    history.merge_record(normalized.tracks, {"id": "t1", "sources": ["zeta"]})
+    history.merge_record(normalized.tracks, {"id": "t1", "sources": ["alpha"]})
+    assert normalized.tracks["t1"]["sources"] == {"alpha", "zeta"}
+
+    assert normalized.event_records()[0]["sources"] == ["alpha", "zeta"]
+    assert normalized.tracks["t1"]["sources"] == ["alpha", "zeta"]
+
+    normalized.add_event("2024-01-01T00:00:00Z", "t1", "beta")
+    history.merge_record(normalized.tracks, {"id": "t1", "sources": ["beta"]})
+    assert normalized.event_records()[0]["sources"] == ["alpha", "beta", "zeta"]
+    assert normalized.track_records()[0]["sources"] == ["alpha", "beta", "zeta"]
+
+
+def test_serialization_output_does_not_depend_on_backend(monkeypatch):
+    sample = {
+        "name": "Beyoncé\u2028 \x1f \x7f 😀",
+        "floats": [1e-05, 1e16, 1.5e15, 0.1, -0.0, 2.0, 123.456, 5e-324],
+        "nested": {"b": [1, None, True], "a": {}, "c": []},
+        "text": "0.00001 and 1e5",
+        "count": 2**40,
+    }
+
+    def encode():
+        return (
+            serialization.dumps(sample),
+            serialization.dumps(sample, sort_keys=True),
+            serialization.dumps_line(sample),
+            serialization.dumps_pretty(sample),
+        )
+
+    installed = encode()
+    monkeypatch.setattr(serialization, "orjson", None)
+    monkeypatch.setattr(serialization, "msgspec", None)
+
+    assert encode() == installed
+    assert installed[3] == json.dumps(sample, indent=2, default=str)
+    assert installed[0] == json.dumps(sample, ensure_ascii=False, separators=(",", ":"))
+
+
+def test_serialization_keeps_the_jsonl_contract():
+    record = {
+        "name": "Café\u2028 \x1f 😀",
+        "id": "x",
+        "nested": {"b": [1, None], "a": True},
+    }
+
+    assert serialization.dumps_line(record) == json.dumps(
+        record, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+    )
+    assert serialization.dumps_line({"big": 2**70}) == '{"big":1180591620717411303424}'
+    assert serialization.loads(b'{"big": 1180591620717411303424}') == {"big": 2**70}
+    assert json.loads(serialization.dumps_pretty({"when": Path("a")})) == {"when": "a"}
+    with pytest.raises(ValueError):
+        serialization.loads("{not json")
+
+
+def test_merge_history_command_unions_sorted_logs(tmp_path):
+    def event(played_at, track_id, *sources):
+        return {
+            "played_at": played_at,
+            "track_id": track_id,
+            "sources": list(sources),
+        }
+
+    api_log = tmp_path / "api.jsonl"
+    history.write_jsonl(
+        api_log,
+        [
+            event("2024-01-01T00:00:00Z", "a", "api"),
+            event("2024-01-03T00:00:00Z", "c", "api"),
+        ],
+    )
+    export_log = tmp_path / "export.jsonl.gz"
+    history.write_jsonl(
+        export_log,
+        [
+            event("2024-01-01T00:00:00Z", "a", "export"),
+            event("2024-01-02T00:00:00Z", "b", "export"),
+        ],
+    )
+    output = tmp_path / "merged.jsonl"
+
+    result = runner.invoke(
+        cli.cli,
+        ["merge-history", str(api_log), str(export_log), "--output", str(output)],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.output) == {"duplicates": 1, "events": 3, "inputs": 2}
+    assert output.read_text() == history.sorted_jsonl(
+        [
+            event("2024-01-01T00:00:00Z", "a", "api", "export"),
+            event("2024-01-02T00:00:00Z", "b", "export"),
+            event("2024-01-03T00:00:00Z", "c", "api"),
+        ]
+    )
+
+    history.write_jsonl(api_log, list(history.EventLogMerge([export_log]))[::-1])
+    with pytest.raises(ValueError, match="is not sorted"):
+        list(history.EventLogMerge([api_log]))
+    assert runner.invoke(cli.cli, ["merge-history", str(api_log)]).exit_code == 2
+
+
 def test_auth_status_reports_saved_token(monkeypatch, tmp_path):
     monkeypatch.setenv("SPOTIFY_CLIENT_ID", "client-id")
     monkeypatch.setenv("SPOTIFY_AUTH_STRING", "auth-string")
@@ -421,10 +1594,17 @@ def test_auth_status_reports_saved_token(monkeypatch, tmp_path):
     monkeypatch.setattr(utils, "TOKEN_FILE", tmp_path / "token.json")
 
     settings = get_settings()
-    utils.write_json(utils.AUTH_FILE, {settings.user_id: {"code": "abc", "scope": utils.SCOPE}})
+    utils.write_json(
+        utils.AUTH_FILE, {settings.user_id: {"code": "abc", "scope": utils.SCOPE}}
+    )
     utils.write_json(
         utils.TOKEN_FILE,
-        {settings.user_id: {"access_token": "token", "expires_at": "2099-01-01 00:00:00"}},
+        {
+            settings.user_id: {
+                "access_token": "token",
+                "expires_at": "2099-01-01 00:00:00",
+            }
+        },
     )
 
     status = utils.get_auth_status()
@@ -434,7 +1614,7 @@ def test_auth_status_reports_saved_token(monkeypatch, tmp_path):
     assert status["token_expired"] is False
 
 
-def test_handle_authorization_prefers_refresh_token_env(monkeypatch):
+def test_handle_authorization_prefers_refresh_token_env(monkeypatch, tmp_path):
     monkeypatch.setenv("SPOTIFY_CLIENT_ID", "client-id")
     monkeypatch.setenv("SPOTIFY_AUTH_STRING", "auth-string")
     monkeypatch.setenv("REDIRECT_URI", "https://example.com/callback")
@@ -445,6 +1625,7 @@ def test_handle_authorization_prefers_refresh_token_env(monkeypatch):
     monkeypatch.delenv("SPOTIFY_PASSWORD", raising=False)
 
     monkeypatch.setattr(utils, "load_json", lambda path: {})
+    monkeypatch.setattr(utils, "TOKEN_FILE", tmp_path / "token_info.json")
     monkeypatch.setattr(
         utils,
         "refresh_token",
@@ -459,7 +1640,9 @@ def test_handle_authorization_prefers_refresh_token_env(monkeypatch):
     assert token_info["refresh_token"] == "refresh-token"
 
 
-def test_handle_authorization_force_still_prefers_refresh_token_env(monkeypatch):
+def test_handle_authorization_force_still_prefers_refresh_token_env(
+    monkeypatch, tmp_path
+):
     monkeypatch.setenv("SPOTIFY_CLIENT_ID", "client-id")
     monkeypatch.setenv("SPOTIFY_AUTH_STRING", "auth-string")
     monkeypatch.setenv("REDIRECT_URI", "https://example.com/callback")
@@ -470,6 +1653,7 @@ def test_handle_authorization_force_still_prefers_refresh_token_env(monkeypatch)
     monkeypatch.delenv("SPOTIFY_PASSWORD", raising=False)
 
     monkeypatch.setattr(utils, "load_json", lambda path: {})
+    monkeypatch.setattr(utils, "TOKEN_FILE", tmp_path / "token_info.json")
     monkeypatch.setattr(
         utils,
         "refresh_token",
@@ -484,6 +1668,204 @@ def test_handle_authorization_force_still_prefers_refresh_token_env(monkeypatch)
     assert token_info["refresh_token"] == "refresh-token"
 
 
+def test_token_store_keeps_every_user_and_reads_legacy_file(tmp_path):
+    legacy = tmp_path / "token_info.json"
+    legacy.write_text(json.dumps({"old": {"access_token": "legacy"}}))
+    store = tokenstore.TokenStore(legacy)
+
+    store.put("alice", {"access_token": "a"})
+    store.put("bob", {"access_token": "b"})
+    store.put("alice", {"access_token": "a2"})
+
+    assert store.get("alice") == {"access_token": "a2"}
+    assert store.get("bob") == {"access_token": "b"}
+    assert store.get("old") == {"access_token": "legacy"}
+    assert store.get("nobody") is None
+    assert sorted(path.name for path in store.directory.glob("*.json")) == [
+        "alice.json",
+        "bob.json",
+    ]
+
+    store.put("old", {"access_token": "new"})
+    assert store.get("old") == {"access_token": "new"}
+
+
+def test_request_token_writes_only_its_own_user(monkeypatch, tmp_path):
+    monkeypatch.setattr(utils, "TOKEN_FILE", tmp_path / "token_info.json")
+    utils.token_store().put("someone-else", {"access_token": "other"})
+    settings = Settings(
+        "client-id", "auth-string", "https://example.com/callback", None, None
+    )
+    monkeypatch.setattr(
+        utils.httpx,
+        "post",
+        lambda url, **kwargs: httpx.Response(
+            200,
+            json={"access_token": "mine", "expires_in": 3600},
+            request=httpx.Request("POST", url),
+        ),
+    )
+
+    utils.request_token("code", write=True, settings=settings)
+
+    store = utils.token_store()
+    assert store.get(settings.user_id)["access_token"] == "mine"
+    assert store.get("someone-else") == {"access_token": "other"}
+
+
+def test_handle_authorization_refreshes_once_for_concurrent_callers(
+    monkeypatch, tmp_path
+):
+    monkeypatch.setattr(utils, "TOKEN_FILE", tmp_path / "token_info.json")
+    settings = Settings(
+        "client-id", "auth-string", "https://example.com/callback", None, None
+    )
+    expired = {
+        "access_token": "expired",
+        "expires_at": "2000-01-01 00:00:00",
+        "refresh_token": "refresh",
+    }
+    utils.token_store().put(settings.user_id, expired)
+    calls = []
+
+    def refresh(refresh_token, write=False, settings=None):
+        calls.append(refresh_token)
+        time.sleep(0.05)
+        return {
+            "access_token": f"fresh-{len(calls)}",
+            "expires_at": dt.now() + timedelta(hours=1),
+            "refresh_token": refresh_token,
+        }
+
+    monkeypatch.setattr(utils, "refresh_token", refresh)
+    results = []
+
+    def authorize():
+        token_info = utils.handle_authorization(save_files=True, settings=settings)
+        results.append(token_info["access_token"])
+
+    threads = [threading.Thread(target=authorize) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    # Each thread locks its own file descriptor, like separate processes do.
+    assert calls == ["refresh"]
+    assert results == ["fresh-1"] * 5
+
+
+def test_token_managers_in_separate_processes_refresh_once(monkeypatch, tmp_path):
+    monkeypatch.setattr(utils, "TOKEN_FILE", tmp_path / "token_info.json")
+    settings = Settings(
+        "client-id", "auth-string", "https://example.com/callback", None, None
+    )
+    expired = {
+        "access_token": "expired",
+        "expires_at": "2000-01-01 00:00:00",
+        "refresh_token": "refresh",
+    }
+    utils.token_store().put(settings.user_id, expired)
+    calls = []
+
+    def refresh(refresh_token, write=False, settings=None):
+        calls.append(refresh_token)
+        return {
+            "access_token": f"fresh-{len(calls)}",
+            "expires_at": dt.now() + timedelta(hours=1),
+            "refresh_token": refresh_token,
+        }
+
+    monkeypatch.setattr(utils, "refresh_token", refresh)
+    managers = [tokens.TokenManager(settings, refresh_margin=300) for _ in range(5)]
+    for manager in managers:
+        manager.set(expired)
+
+    # Each manager stands in for a process holding the same stale token.
+    assert [manager.access_token() for manager in managers] == ["fresh-1"] * 5
+    assert calls == ["refresh"]
+
+
+def token_manager(authorize):
+    settings = Settings(
+        "client-id", "auth-string", "https://example.com/callback", None, None
+    )
+    return tokens.TokenManager(settings, refresh_margin=300, authorize=authorize)
+
+
+def test_token_manager_refreshes_in_background_near_expiry():
+    refreshed = threading.Event()
+    calls = []
+
+    def authorize(save_files, force, settings, **kwargs):
+        calls.append(force)
+        if force:
+            refreshed.set()
+            expires_at = dt.now() + timedelta(hours=1)
+            return {"access_token": "fresh", "expires_at": expires_at}
+        expires_at = dt.now() + timedelta(seconds=60)
+        return {"access_token": "stale", "expires_at": expires_at.isoformat()}
+
+    manager = token_manager(authorize)
+
+    # The near-expiry token is served while the refresh runs on another thread.
+    assert manager.access_token() == "stale"
+    assert manager.access_token() in {"stale", "fresh"}
+    assert refreshed.wait(5)
+    manager._refreshing.join(5)
+    assert manager.access_token() == "fresh"
+    assert calls == [False, True]
+
+
+def test_token_manager_schedules_refresh_when_first_load_is_near_expiry():
+    calls = []
+
+    def authorize(save_files, force, settings, **kwargs):
+        calls.append(force)
+        if force:
+            expires_at = dt.now() + timedelta(hours=1)
+            return {"access_token": "fresh", "expires_at": expires_at}
+        expires_at = dt.now() + timedelta(seconds=60)
+        return {"access_token": "stale", "expires_at": expires_at}
+
+    manager = token_manager(authorize)
+
+    assert manager.access_token() == "stale"
+    manager._refreshing.join(5)
+    assert calls == [False, True]
+    assert manager.access_token() == "fresh"
+
+
+def test_token_manager_refreshes_expired_token_before_returning():
+    def authorize(save_files, force, settings, **kwargs):
+        if force:
+            expires_at = dt.now() + timedelta(hours=1)
+            return {"access_token": "fresh", "expires_at": expires_at}
+        expires_at = dt.now() - timedelta(seconds=1)
+        return {"access_token": "expired", "expires_at": expires_at}
+
+    manager = token_manager(authorize)
+    manager.set(authorize(save_files=False, force=False, settings=None))
+
+    assert manager.access_token() == "fresh"
+
+
+def test_client_resolves_token_callable_per_request():
+    tokens_seen = []
+
+    def handler(request):
+        tokens_seen.append(request.headers["Authorization"])
+        return httpx.Response(200, json={})
+
+    issued = iter(["first", "second"])
+    with api.SpotifyClient(transport=httpx.MockTransport(handler)) as client:
+        token = lambda: next(issued)  # noqa: E731
+        client.get(token, "/me")
+        client.get(token, "/me")
+
+    assert tokens_seen == ["Bearer first", "Bearer second"]
+
+
 def test_skip_if_audio_endpoint_forbidden_skips_on_spotify_403():
     class Result:
         exit_code = 1